@@ -0,0 +1,71 @@
+"""Lookup benchmark for the typo-tolerant fuzzy utterance index.
+
+usage:
+```
+    $ python benchmarks/fuzzy_index.py --utterances 50000 --queries 1000
+```
+"""
+from __future__ import print_function
+import argparse
+import random
+import string
+import time
+
+from navi.conversational.fuzzy import FuzzyMatchResolver
+
+
+def _synthetic_utterances(n_utterances, n_intents, seed=0):
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase)
+                     for _ in range(rng.randint(2, 8)))
+             for _ in range(3000)]
+    utterances = {}
+    while len(utterances) < n_utterances:
+        utterance = " ".join(rng.choice(words)
+                             for _ in range(rng.randint(3, 7)))
+        utterances[utterance] = "Intent{}".format(
+            len(utterances) % n_intents)
+    return utterances
+
+
+def _mistype(utterance, rng):
+    i = rng.randrange(len(utterance))
+    return utterance[:i] + rng.choice(string.ascii_lowercase) + \
+        utterance[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--utterances', type=int, default=50000)
+    parser.add_argument('--intents', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    utterances = _synthetic_utterances(args.utterances, args.intents)
+    resolver = FuzzyMatchResolver(utterances)
+
+    start = time.time()
+    resolver.start()
+    resolver.lookup("warm up")
+    print("build: {} utterances in {:.3f}s".format(args.utterances,
+                                                   time.time() - start))
+
+    rng = random.Random(1)
+    known = list(utterances)
+    queries = [rng.choice(known) for _ in range(args.queries)]
+
+    timings, correct = [], 0
+    for query in queries:
+        start = time.time()
+        response = resolver.parser(None, _mistype(query, rng), {})
+        timings.append(time.time() - start)
+        correct += response.intent == utterances[query]
+    timings.sort()
+    print("lookup: p50 {:.3f}ms p99 {:.3f}ms, {}/{} resolved".format(
+        timings[len(timings) // 2] * 1000,
+        timings[int(len(timings) * 0.99)] * 1000,
+        correct, len(queries)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Training and inference benchmark for the local conversational platform.
+
+usage:
+```
+    $ python benchmarks/local_nlu.py --examples 10000 --queries 1000
+```
+"""
+from __future__ import print_function
+import argparse
+import random
+import time
+
+from navi.conversational.local import LocalConversationalPlatform
+
+WORDS = ("turn on off the lights music play stop next song weather today "
+         "tomorrow in at what is set alarm timer for minutes call mom dad "
+         "send message remind me to buy milk open door close window how "
+         "much does cost order pizza book table tonight").split()
+
+
+def _synthetic_examples(n_examples, n_intents, seed=0):
+    rng = random.Random(seed)
+    examples = {}
+    for i in range(n_examples):
+        intent = "Intent{}".format(i % n_intents)
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 9))]
+        examples.setdefault(intent, []).append(" ".join(words))
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--examples', type=int, default=10000)
+    parser.add_argument('--intents', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    examples = _synthetic_examples(args.examples, args.intents)
+    platform = LocalConversationalPlatform(examples=examples)
+
+    start = time.time()
+    platform.train(examples)
+    print("train: {} examples in {:.3f}s".format(args.examples,
+                                                 time.time() - start))
+
+    utterances = [u for intent in examples.values() for u in intent]
+    rng = random.Random(1)
+    queries = [rng.choice(utterances) for _ in range(args.queries)]
+
+    timings = []
+    for query in queries:
+        start = time.time()
+        platform.classify(query)
+        timings.append(time.time() - start)
+    timings.sort()
+    print("inference: p50 {:.3f}ms p99 {:.3f}ms".format(
+        timings[len(timings) // 2] * 1000,
+        timings[int(len(timings) * 0.99)] * 1000))
+
+
+if __name__ == '__main__':
+    main()
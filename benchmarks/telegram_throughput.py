@@ -0,0 +1,76 @@
+"""End to end throughput and latency of the telegram messaging path, against
+a local fake Bot API.
+
+An echo entry point replies to every update, so the numbers measure navi's
+receiving, dispatching and replying overhead.
+
+usage:
+```
+    $ python benchmarks/telegram_throughput.py --updates 5000 --rate 500 \\
+        --users 1000 --workers 8
+    $ python benchmarks/telegram_throughput.py --webhook
+```
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from navi.core import Navi, entry_point
+from navi.messaging.fake_bot_api import FakeBotAPI
+from navi.messaging.telegram_platform import Telegram
+from navi.messaging.webhook import Webhook
+
+
+@entry_point('telegram')
+def echo(message, context):
+    return message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--webhook', action='store_true')
+    parser.add_argument('--webhook-port', type=int, default=8443)
+    args = parser.parse_args()
+
+    Navi.context["users"] = {}
+    Navi.context["users_metadata"] = {}
+
+    api = FakeBotAPI()
+    api.start()
+
+    webhook = None
+    if args.webhook:
+        webhook = Webhook(
+            host='127.0.0.1', port=args.webhook_port, path='/telegram',
+            public_url="http://127.0.0.1:{}/telegram".format(
+                args.webhook_port))
+    telegram = Telegram('telegram', "123:fake", base_url=api.base_url,
+                        webhook=webhook, workers=args.workers)
+
+    t = threading.Thread(target=telegram.start)
+    t.daemon = True
+    t.start()
+
+    start = time.time()
+    api.generate(rate=args.rate, users=args.users, count=args.updates)
+    done = api.wait_for_replies(args.updates, timeout=60)
+    elapsed = time.time() - start
+
+    stats = api.stats()
+    print("{} updates from {} users at {}/s, {} replies in {:.2f}s{}".format(
+        args.updates, args.users, args.rate, stats['replies'], elapsed,
+        "" if done else " (timed out)"))
+    latency = stats['latency']
+    if latency.get('count'):
+        print("reply latency: p50 {:.1f}ms p90 {:.1f}ms p99 {:.1f}ms".format(
+            latency['p50'] * 1000, latency['p90'] * 1000,
+            latency['p99'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Throughput and latency of the wit conversational platform against a local
+fake wit, with scripted latency and error rate.
+
+usage:
+```
+    $ python benchmarks/wit_parser.py --messages 2000 --concurrency 32 \\
+        --median-latency 0.08 --error-rate 0.01
+```
+"""
+from __future__ import print_function
+import argparse
+import random
+import threading
+import time
+
+from navi.core import Navi
+from navi.conversational.fake_wit import FakeWit
+from navi.conversational.wit_ai import WitConversationalPlatform
+from navi.resilience import LatencyRecorder
+
+
+def _script(n_utterances, n_intents, seed=0):
+    rng = random.Random(seed)
+    return {"utterance number {} {}".format(i, rng.randint(0, 1 << 30)):
+            "Intent{}".format(i % n_intents)
+            for i in range(n_utterances)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--utterances', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--median-latency', type=float, default=0.05)
+    parser.add_argument('--sigma', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-coalescing', action='store_true')
+    args = parser.parse_args()
+
+    Navi.context["users"] = {}
+    Navi.context["users_metadata"] = {}
+
+    script = _script(args.utterances, 20)
+    fake_wit = FakeWit(script,
+                       latency=FakeWit.lognormal(args.median_latency,
+                                                 args.sigma),
+                       error_rate=args.error_rate)
+    fake_wit.start()
+
+    platform = WitConversationalPlatform(
+        "fake", base_url=fake_wit.url,
+        coalesce_requests=not args.no_coalescing)
+    platform.start()
+
+    rng = random.Random(1)
+    utterances = list(script)
+    messages = [rng.choice(utterances) for _ in range(args.messages)]
+    latency = LatencyRecorder(size=args.messages)
+    results = {'correct': 0}
+    lock = threading.Lock()
+
+    def run(chunk):
+        for message in chunk:
+            start = time.time()
+            response = platform.parser(None, message, {})
+            latency.record(time.time() - start)
+            with lock:
+                results['correct'] += response.intent == script[message]
+
+    threads = [threading.Thread(target=run,
+                                args=(messages[i::args.concurrency],))
+               for i in range(args.concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    stats = latency.stats()
+    print("{} messages in {:.2f}s ({:.1f}/s), {} parsed correctly".format(
+        args.messages, elapsed, args.messages / elapsed, results['correct']))
+    print("parser latency: p50 {:.1f}ms p90 {:.1f}ms p99 {:.1f}ms".format(
+        stats['p50'] * 1000, stats['p90'] * 1000, stats['p99'] * 1000))
+    print("fake wit: {}".format(fake_wit.stats()))
+    print("breaker: {}".format(platform.stats()['breaker']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPPool(object):
+    """Shared pool of persistent HTTP connections for navi platforms.
+
+    A single urllib3 pool manager keeps up to `max_connections_per_host`
+    connections alive for each of up to `max_hosts` hosts. It is exposed as
+    a `requests.Session` (used by the wit platform), built on the first
+    request so platforms that don't use it don't need requests. The
+    telegram platform keeps python-telegram-bot's own `Request`, with its
+    timeouts and socket options, sized by this pool and included in its
+    stats.
+
+    usage:
+    ```
+        >>> from navi import connections
+        >>> connections.configure(max_connections_per_host=16)
+        >>> ...
+        >>> connections.shared_pool().stats()
+    ```
+    """
+
+    def __init__(self, max_connections_per_host=10, max_hosts=10,
+                 keep_alive=True, block=False, connect_timeout=5.0,
+                 read_timeout=30.0):
+        """
+        :param max_connections_per_host: connections kept for each host
+
+        :param max_hosts: hosts whose connections are kept at the same time
+
+        :param keep_alive: if False, every request asks for the connection to
+        be closed after the response
+
+        :param block: if True, a request waits for a free connection instead
+        of opening an extra (non pooled) one when the host limit is reached
+
+        :param connect_timeout: default seconds to wait for a connection
+
+        :param read_timeout: default seconds to wait for a response, so a
+        hung server never holds a thread and a connection forever
+        """
+        self.max_connections_per_host = max_connections_per_host
+        self.max_hosts = max_hosts
+        self.keep_alive = keep_alive
+        self.block = block
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_manager = None
+        self.session = None
+        self._telegram_requests = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        # requests overrides the pool's default timeout with its own, which
+        # is no timeout at all, so the default is passed on every request
+        kwargs.setdefault('timeout', (self.connect_timeout,
+                                      self.read_timeout))
+        return self._session().request(method, url, **kwargs)
+
+    def _session(self):
+        with self._lock:
+            if self.session is None:
+                (self.pool_manager, self.session) = self._build_session()
+            return self.session
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.certs import where as ca_certs_path
+        from requests.packages.urllib3 import PoolManager, Timeout
+
+        class SharedPoolAdapter(HTTPAdapter):
+            """Sends every request through the pool's manager instead of
+            creating its own"""
+
+            def init_poolmanager(self, *kvars, **kwargs):
+                self.poolmanager = pool_manager
+
+        pool_manager = PoolManager(num_pools=self.max_hosts,
+                                   maxsize=self.max_connections_per_host,
+                                   block=self.block,
+                                   timeout=Timeout(connect=self.connect_timeout,
+                                                   read=self.read_timeout),
+                                   cert_reqs='CERT_REQUIRED',
+                                   ca_certs=ca_certs_path())
+        session = requests.Session()
+        adapter = SharedPoolAdapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return (pool_manager, session)
+
+    def telegram_request(self, **kwargs):
+        """Build a python-telegram-bot `Request` sized like this pool. It
+        keeps its own connections, timeouts and socket options; this pool
+        only reports its stats"""
+        from telegram.utils.request import Request
+        request = Request(con_pool_size=self.max_connections_per_host,
+                          **kwargs)
+        self._telegram_requests.append(request)
+        return request
+
+    def stats(self):
+        """Requests served and connections opened for each host. Every
+        request beyond the opened connections reused a kept-alive one
+        """
+        stats = {}
+        # ptb 5.3.1 has no public accessor for its pool manager
+        managers = [request._con_pool for request in self._telegram_requests]
+        if self.pool_manager is not None:
+            managers.append(self.pool_manager)
+        for manager in managers:
+            stats.update(_pool_stats(manager))
+        return stats
+
+
+def _pool_stats(pool_manager):
+    stats = {}
+    pools = pool_manager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+        stats[host] = {
+            'requests': pool.num_requests,
+            'connections': pool.num_connections,
+            'reused': max(0, pool.num_requests - pool.num_connections),
+            'idle': len([c for c in pool.pool.queue if c is not None])
+            if pool.pool else 0,
+        }
+    return stats
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replace the process-wide pool with one built from `kwargs` (see
+    `HTTPPool`). Must be called before platforms are created
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        _shared_pool = HTTPPool(**kwargs)
+    return _shared_pool
+
+
+def shared_pool():
+    """The process-wide pool used by every navi platform by default"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = HTTPPool()
+        return _shared_pool
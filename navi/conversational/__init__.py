@@ -1,6 +1,7 @@
 from enum import Enum
 import uuid
 import logging
+import threading
 
 from pydispatch import dispatcher
 
@@ -9,10 +10,19 @@ from navi import context as ctx
 from navi.intents import Intent
 from navi.handlers import IntentHandler
 from navi import responses
+from navi import workers
+from navi.resilience import call_with_timeout, CallTimeout
+from .batching import HandleBatcher
+from . import middleware
 
 
 logger = logging.getLogger(__name__)
 
+handle_batcher = HandleBatcher()
+
+_stage_timeouts = {}
+_stage_timeouts_lock = threading.Lock()
+
 
 class ConversationalResponse(object):
 
@@ -40,6 +50,16 @@ class ConversationalResponse(object):
 
 class ConversationalPlatform(Enum):
     wit_ai = 0
+    local = 1
+    tiered = 2
+
+
+def normalize_message(message):
+    """Normalize a user message so that trivially different texts (case,
+    surrounding or repeated whitespace) share the same key"""
+    if not message:
+        return ""
+    return " ".join(message.lower().split())
 
 
 def parse_message(message,
@@ -47,6 +67,16 @@ def parse_message(message,
                   platform=ConversationalPlatform.wit_ai,
                   confidence_threshold=0.1):
 
+    chain = middleware.chain
+    reply = chain.before_nlu(message, context)
+    if reply is None:
+        reply = _parse_message(message, context, platform,
+                               confidence_threshold, chain)
+    return chain.after_reply(message, reply, context)
+
+
+def _parse_message(message, context, platform, confidence_threshold, chain):
+
     if not message:
         return _parsing_error(message, context)
 
@@ -61,12 +91,23 @@ def parse_message(message,
     chosen_platform = None
     if platform == ConversationalPlatform.wit_ai:
         chosen_platform = ctx.general()['wit_ai']
+    elif platform == ConversationalPlatform.local:
+        chosen_platform = ctx.general()['local_nlu']
+    elif platform == ConversationalPlatform.tiered:
+        chosen_platform = ctx.general()['nlu_router']
 
     # every platform parser is a python generator
     response = chosen_platform.parser(session, message, context)
 
     logger.info("Parser response: %s", response)
 
+    reply = chain.after_nlu(message, response, context)
+    if reply is not None:
+        ctx.clean_user_error_context(context)
+        ctx.clean_user_context(context)
+        ctx.set_session_was_closed(context)
+        return reply
+
     if response.confidence < confidence_threshold:
         return _parsing_error(message, context)
 
@@ -77,6 +118,12 @@ def parse_message(message,
             ctx.set_session_was_closed(context)
         return response.messages
 
+    # merge locally extracted gazetteer entities, parser entities win
+    gazetteer = ctx.general().get('gazetteer')
+    if gazetteer is not None:
+        response.entities = dict(gazetteer.extract(message),
+                                 **response.entities)
+
     intent_name = None
     if response.intent is None:
         if 'intent' in context:
@@ -100,7 +147,10 @@ def parse_message(message,
         handler = IntentHandler()
 
     # 1. Resolve
-    resolve_responses = handler.resolve(intent, context)
+    try:
+        resolve_responses = _run_stage(handler, "resolve", intent, context)
+    except CallTimeout:
+        return _stage_timeout(handler, "resolve", intent, context)
     (must_ask, messages) = _parse_resolve_result(resolve_responses,
                                                  intent, context)
 
@@ -112,7 +162,10 @@ def parse_message(message,
             return ""
 
     # 2. Confirm
-    confirm_response = handler.confirm(intent, context)
+    try:
+        confirm_response = _run_stage(handler, "confirm", intent, context)
+    except CallTimeout:
+        return _stage_timeout(handler, "confirm", intent, context)
     (is_ready, message) = _parse_confirm_result(confirm_response, intent,
                                                 context)
 
@@ -123,7 +176,17 @@ def parse_message(message,
             return ""
 
     # 3. Handle
-    handle_response = handler.handle(intent, context)
+    reply = chain.before_handle(intent, handler, context)
+    if reply is not None:
+        ctx.clean_user_error_context(context)
+        ctx.clean_user_context(context)
+        ctx.set_session_was_closed(context)
+        return reply
+
+    try:
+        handle_response = _run_stage(handler, "handle", intent, context)
+    except CallTimeout:
+        return _stage_timeout(handler, "handle", intent, context)
     message = _parse_handle_result(handle_response, intent,
                                    context)
 
@@ -137,6 +200,74 @@ def parse_message(message,
         return ""
 
 
+def _run_stage(handler, stage, intent, context):
+
+    deadline = getattr(handler, "{}_deadline".format(stage))
+    if stage == "resolve":
+        func = handler.resolve
+        if handler.parallel_resolve:
+            deadline = None  # enforced per entity by the handler
+    elif stage == "confirm":
+        func = handler.confirm
+    else:
+        func = lambda intent, context: _handle(handler, intent, context)
+
+    return call_with_timeout(deadline, func, intent, context)
+
+
+def _stage_timeout(handler, stage, intent, context):
+
+    intent_name = type(intent).__name__
+    logger.warning("%s stage of %s missed its deadline", stage, intent_name)
+    handler.cancel()
+    with _stage_timeouts_lock:
+        counts = _stage_timeouts.setdefault(
+            intent_name, {"resolve": 0, "confirm": 0, "handle": 0})
+        counts[stage] += 1
+
+    message = responses.get(for_intent=intent.__class__,
+                            for_status=Intent.TimeoutResponse[stage])
+    if message is None:
+        message = responses.get(for_key="timeout")
+
+    ctx.clean_user_error_context(context)
+    ctx.clean_user_context(context)
+    ctx.set_session_was_closed(context)
+
+    if message is None:
+        return "timeout"
+    return message
+
+
+def timeout_stats():
+    """Number of stage deadlines missed per intent"""
+    with _stage_timeouts_lock:
+        return {name: dict(counts)
+                for name, counts in _stage_timeouts.items()}
+
+
+def _handle(handler, intent, context):
+
+    cache = handler.handle_cache
+    if cache is not None:
+        handle_response = cache.get(intent)
+        if handle_response is not None:
+            logger.info("Serving cached result for %s",
+                        type(intent).__name__)
+            return handle_response
+
+    if handler.batch_window:
+        handle_response = handle_batcher.handle(handler, intent, context)
+    elif handler.cpu_bound:
+        handle_response = workers.handle_in_process(handler, intent, context)
+    else:
+        handle_response = handler.handle(intent, context)
+
+    if cache is not None:
+        cache.set(intent, handle_response)
+    return handle_response
+
+
 def _parsing_error(message, context):
 
     ctx.clean_user_error_context(context)
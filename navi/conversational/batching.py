@@ -0,0 +1,85 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.intents = []
+        self.contexts = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.responses = None
+        self.error = None
+
+
+class HandleBatcher(object):
+    """Group concurrent `handle` calls for the same intent into a single
+    `handle_batch(intents, contexts)` call.
+
+    The first call for an intent opens a batch and waits up to the
+    handler's `batch_window` seconds (or until `max_batch_size` calls have
+    joined) before running it. Every caller then receives the response at
+    its own position.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches = {}
+        self.batches = 0
+        self.batched_calls = 0
+
+    def handle(self, handler, intent, context):
+        key = (type(handler), type(intent))
+        with self._lock:
+            batch = self._batches.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = _Batch()
+                self._batches[key] = batch
+            index = len(batch.intents)
+            batch.intents.append(intent)
+            batch.contexts.append(context)
+            if len(batch.intents) >= handler.max_batch_size:
+                self._batches.pop(key, None)
+                batch.full.set()
+
+        if not is_leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(handler.batch_window)
+            with self._lock:
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+                self.batches += 1
+                self.batched_calls += len(batch.intents)
+            self._run(handler, batch)
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.responses[index]
+
+    def _run(self, handler, batch):
+        logger.info("Handling batch of %d %s", len(batch.intents),
+                    type(batch.intents[0]).__name__)
+        try:
+            responses = list(handler.handle_batch(batch.intents,
+                                                  batch.contexts))
+            if len(responses) != len(batch.intents):
+                raise ValueError("handle_batch returned {} responses for {} "
+                                 "intents".format(len(responses),
+                                                  len(batch.intents)))
+            batch.responses = responses
+        except Exception as e:
+            logger.exception(e)
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {'batches': self.batches,
+                    'batched_calls': self.batched_calls,
+                    'open_batches': len(self._batches)}
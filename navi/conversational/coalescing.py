@@ -0,0 +1,75 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls that share the same key.
+
+    While a call for a key is in flight, any other caller asking for the
+    same key waits for it and receives its result (or its exception)
+    instead of issuing a call of its own.
+
+    usage:
+    ```
+        >>> flight = SingleFlight()
+        >>> result = flight.do("what time is it", client.message,
+        >>>                    "What time is it?")
+    ```
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *kvars, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            logger.debug("Coalesced call for key %s", key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*kvars, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """Number of calls actually issued and of calls saved by coalescing"""
+        with self._lock:
+            return {'calls': self.calls,
+                    'saved': self.coalesced,
+                    'in_flight': len(self._calls)}
@@ -0,0 +1,215 @@
+from collections import deque
+import random
+import threading
+import time
+import uuid
+import logging
+
+try:
+    from urlparse import urlparse, parse_qsl
+except ImportError:
+    from urllib.parse import urlparse, parse_qsl
+
+from navi.http_server import (ThreadingHTTPServer, BaseHTTPRequestHandler,
+                              respond)
+from . import normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+class FakeWit(object):
+    """Local stand-in for wit.ai's `/message` and `/converse` endpoints, to
+    benchmark and test the conversation engine without a live token.
+
+    Answers come from a scripted table of utterance to intent and entities,
+    looked up by the normalized message; unknown messages get no entities.
+    Each request waits for a delay drawn from `latency` and fails with a
+    500 with probability `error_rate`. The random draws are seeded, so a
+    run is reproducible.
+
+    `/converse` replays the `stories` steps scripted for the utterance, or
+    runs the intent as a wit action and stops when there are none.
+
+    usage:
+    ```
+        >>> fake_wit = FakeWit(
+        >>>     {"turn on the lights": ('LightsIntent', {'state': "on"}),
+        >>>      "what's the weather": 'WeatherIntent'},
+        >>>     latency=FakeWit.lognormal(median=0.08, sigma=0.5),
+        >>>     error_rate=0.01)
+        >>> fake_wit.start()
+        >>> wit = WitConversationalPlatform("fake", base_url=fake_wit.url)
+    ```
+    """
+
+    def __init__(self, script, stories=None, latency=0, error_rate=0.0,
+                 host='127.0.0.1', port=0, seed=0):
+        """
+        :param script: dictionary of utterance to either an intent name or
+        an (intent name, entities dictionary[, confidence]) tuple
+
+        :param stories: optional dictionary of utterance to the list of
+        converse steps returned for it (eg. `{'type': 'msg', 'msg': "hi"}`)
+
+        :param latency: seconds each request takes, either a number or a
+        callable receiving a `random.Random` and returning one
+
+        :param error_rate: fraction of requests answered with a 500
+
+        :param port: port the server listens on, 0 picks a free one
+        """
+        self.script = {normalize_message(utterance): _scripted(answer)
+                       for (utterance, answer) in script.items()}
+        self.stories = {normalize_message(utterance): steps
+                        for (utterance, steps) in (stories or {}).items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self.server = None
+
+        self._random = random.Random(seed)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @staticmethod
+    def lognormal(median, sigma):
+        """Latency distribution with the long tail typical of remote calls"""
+        def latency(rng):
+            return rng.lognormvariate(0, sigma) * median
+        return latency
+
+    @staticmethod
+    def uniform(low, high):
+        def latency(rng):
+            return rng.uniform(low, high)
+        return latency
+
+    @property
+    def url(self):
+        """URL to give `WitConversationalPlatform(base_url=...)`"""
+        return "http://{}:{}".format(self.host, self.port)
+
+    def start(self):
+        """Start serving on a daemon thread"""
+        fake_wit = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep connections alive, as wit.ai does
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, don't let them
+            # wait on each other's ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake_wit._handle(self)
+
+            def do_POST(self):
+                fake_wit._handle(self)
+
+            def log_message(self, format, *kvars):
+                logger.debug(format, *kvars)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        logger.info("Fake wit listening on %s", self.url)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+    def _draw(self):
+        """Delay and failure of the next request"""
+        with self._lock:
+            self.requests += 1
+            if callable(self.latency):
+                delay = self.latency(self._random)
+            else:
+                delay = self.latency
+            fails = self._random.random() < self.error_rate
+            if fails:
+                self.errors += 1
+        return (max(0, delay), fails)
+
+    def _handle(self, request):
+        url = urlparse(request.path)
+        params = dict(parse_qsl(url.query))
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            request.rfile.read(length)
+
+        if url.path == '/message':
+            endpoint = self._message
+        elif url.path == '/converse' and request.command == 'POST':
+            endpoint = self._converse
+        else:
+            return respond(request, 404, {'error': "Unknown endpoint",
+                                           'code': 'not-found'})
+
+        (delay, fails) = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fails:
+            return respond(request, 500, {'error': "Scripted failure",
+                                           'code': 'unknown'})
+        respond(request, 200, endpoint(params))
+
+    def _message(self, params):
+        text = params.get('q', '')
+        return {'msg_id': str(uuid.uuid4()),
+                '_text': text,
+                'entities': self._entities(text)}
+
+    def _entities(self, text):
+        scripted = self.script.get(normalize_message(text))
+        if scripted is None:
+            return {}
+        (intent, entities, confidence) = scripted
+        result = {'intent': [{'value': intent, 'confidence': confidence}]}
+        for (name, value) in entities.items():
+            result[name] = [{'value': value, 'confidence': confidence}]
+        return result
+
+    def _converse(self, params):
+        session_id = params.get('session_id')
+        text = params.get('q')
+        with self._lock:
+            if text:
+                self._sessions[session_id] = deque(self._story(text))
+            steps = self._sessions.get(session_id)
+            step = steps.popleft() if steps else {'type': 'stop'}
+            if not steps:
+                self._sessions.pop(session_id, None)
+        return dict(step, confidence=step.get('confidence', 1.0))
+
+    def _story(self, text):
+        steps = self.stories.get(normalize_message(text))
+        if steps is not None:
+            return steps
+        entities = self._entities(text)
+        if 'intent' not in entities:
+            return [{'type': 'stop'}]
+        return [{'type': 'action',
+                 'action': entities['intent'][0]['value'],
+                 'entities': entities},
+                {'type': 'stop'}]
+
+
+def _scripted(answer):
+    if not isinstance(answer, tuple):
+        return (answer, {}, 1.0)
+    if len(answer) == 2:
+        return answer + (1.0,)
+    return answer
+
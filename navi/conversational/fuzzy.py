@@ -0,0 +1,153 @@
+import logging
+
+import numpy as np
+
+from . import ConversationalResponse, normalize_message
+from .routing import UtteranceIndexResolver
+
+logger = logging.getLogger(__name__)
+
+
+class FuzzyMatchResolver(UtteranceIndexResolver):
+    """Typo-tolerant index of known utterances.
+
+    Candidates are gathered from a character trigram inverted index and then
+    verified with a bounded edit distance. The reported confidence is the
+    similarity `1 - distance / max(len(message), len(utterance))`, so it
+    plugs straight into a `TieredConversationalRouter` tier threshold.
+
+    usage:
+    ```
+        >>> router.add_tier('fuzzy', FuzzyMatchResolver(max_distance=2),
+        >>>                 threshold=0.8)
+    ```
+    """
+
+    def __init__(self, utterances=None, max_distance=2, candidates=8):
+        """
+        :param max_distance: largest edit distance still considered a match
+
+        :param candidates: number of utterances, ranked by shared trigrams,
+        whose edit distance is verified
+        """
+        super(FuzzyMatchResolver, self).__init__(utterances)
+        self.max_distance = max_distance
+        self.candidates = candidates
+        self.utterance_list = []
+        self.targets = []
+        self.exact = {}
+        self.postings = {}
+        self._compiled = None
+
+    def add(self, utterance, intent_name, entities=None):
+        utterance = normalize_message(utterance)
+        if not utterance or utterance in self.exact:
+            return
+        utterance_id = len(self.utterance_list)
+        self.utterance_list.append(utterance)
+        self.targets.append((intent_name, entities or {}))
+        self.exact[utterance] = utterance_id
+        for gram in _trigrams(utterance):
+            self.postings.setdefault(gram, []).append(utterance_id)
+        self._compiled = None
+
+    def _compile(self):
+        vocabulary = {}
+        lengths, indices = [], []
+        for gram, ids in self.postings.items():
+            vocabulary[gram] = len(vocabulary)
+            lengths.append(len(ids))
+            indices.extend(ids)
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self._compiled = (vocabulary, indptr,
+                          np.asarray(indices, dtype=np.int64))
+        return self._compiled
+
+    def lookup(self, message):
+        """Closest known utterance as (utterance id, similarity), or
+        (None, 0.0) when none is within `max_distance`
+        """
+        message = normalize_message(message)
+        if message in self.exact:
+            return (self.exact[message], 1.0)
+        if not message or not self.utterance_list:
+            return (None, 0.0)
+
+        (vocabulary, indptr, indices) = self._compiled or self._compile()
+        cols = np.asarray([vocabulary[g] for g in _trigrams(message)
+                           if g in vocabulary], dtype=np.int64)
+        if len(cols) == 0:
+            return (None, 0.0)
+
+        starts, ends = indptr[cols], indptr[cols + 1]
+        lengths = ends - starts
+        positions = (np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                     + np.arange(lengths.sum()))
+        shared = np.bincount(indices[positions],
+                             minlength=len(self.utterance_list))
+
+        n_candidates = min(self.candidates, len(shared))
+        candidates = np.argpartition(-shared, n_candidates - 1)[:n_candidates]
+        candidates = candidates[np.argsort(-shared[candidates])]
+
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            if shared[candidate] == 0:
+                break
+            distance = bounded_edit_distance(
+                message, self.utterance_list[candidate], best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = int(candidate), distance
+
+        if best is None:
+            return (None, 0.0)
+        longest = max(len(message), len(self.utterance_list[best]))
+        return (best, 1.0 - float(best_distance) / longest)
+
+    def parser(self, session, message, context):
+        (utterance_id, similarity) = self.lookup(message)
+        if utterance_id is None:
+            return ConversationalResponse()
+
+        (intent_name, entities) = self.targets[utterance_id]
+        original_res = {'utterance': self.utterance_list[utterance_id],
+                        'similarity': similarity}
+        return ConversationalResponse(intent=intent_name,
+                                      entities=dict(entities),
+                                      ready=False,
+                                      original_res=original_res,
+                                      confidence=similarity)
+
+
+def _trigrams(text):
+    text = "  {} ".format(text)
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """Levenshtein distance between `a` and `b`, or `max_distance + 1` as
+    soon as it is known to be larger than `max_distance`
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [max_distance + 1] * len(b)
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        row_min = current[0] if low == 1 else max_distance + 1
+        for j in range(low, high + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + cost)
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return min(previous[len(b)], max_distance + 1)
@@ -0,0 +1,163 @@
+import os
+import pickle
+import hashlib
+import logging
+from collections import deque
+
+from navi import context as ctx
+from . import normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+class GazetteerEntityExtractor(object):
+    """Local entity extraction over large closed vocabularies.
+
+    Every gazetteer phrase is compiled into a single Aho-Corasick automaton,
+    so each message is scanned once regardless of how many phrases there
+    are. Matches are whole words only, and overlapping matches are resolved
+    leftmost-longest. Once started, `parse_message` merges the extracted
+    entities into the conversational response before filling the intent
+    slots; entities found by the conversational platform take precedence.
+
+    usage:
+    ```
+        >>> gazetteer = GazetteerEntityExtractor(
+        >>>     {'city': ["sao paulo", "london", "new york"],
+        >>>      'product': {"iphone x": "iphone_10", "iphone 10": "iphone_10"}},
+        >>>     cache_path="gazetteer.cache")
+        >>> bot.start(conversational_platforms=[wit_platform, gazetteer])
+    ```
+    """
+
+    def __init__(self, gazetteers, cache_path=None):
+        """
+        :param gazetteers: dictionary of entity name to either a list of
+        values or a dictionary of phrase to canonical value
+
+        :param cache_path: if provided, the compiled automaton is stored on
+        this file and reused while the gazetteers stay the same
+        """
+        self.gazetteers = gazetteers
+        self.cache_path = cache_path
+        self.automaton = None
+
+    def start(self):
+        self.automaton = self._load_or_build()
+        ctx.general()['gazetteer'] = self
+
+    def _phrases(self):
+        for entity_name in sorted(self.gazetteers):
+            entries = self.gazetteers[entity_name]
+            if isinstance(entries, dict):
+                items = sorted(entries.items())
+            else:
+                items = [(value, value) for value in entries]
+            for (phrase, value) in items:
+                phrase = normalize_message(phrase)
+                if phrase:
+                    yield (phrase, entity_name, value)
+
+    def _load_or_build(self):
+        phrases = list(self._phrases())
+        digest = hashlib.sha1(repr(phrases).encode('utf-8')).hexdigest()
+
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'rb') as f:
+                    (cached_digest, automaton) = pickle.load(f)
+                if cached_digest == digest:
+                    logger.info("Loaded gazetteer automaton from %s",
+                                self.cache_path)
+                    return automaton
+            except Exception as e:
+                logger.warning("Ignoring gazetteer cache: %s", e)
+
+        automaton = AhoCorasick(phrases)
+        logger.info("Built gazetteer automaton with %d phrases and %d "
+                    "states", len(phrases), len(automaton.goto))
+
+        if self.cache_path:
+            tmp_path = "{}.tmp".format(self.cache_path)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((digest, automaton), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.cache_path)
+
+        return automaton
+
+    def matches(self, message):
+        """All non-overlapping (entity name, value, start, end) matches"""
+        if self.automaton is None:
+            self.automaton = self._load_or_build()
+        return self.automaton.search(normalize_message(message))
+
+    def extract(self, message):
+        """Entities dictionary in the same simplified shape used by
+        `ConversationalResponse.entities`, first match of each entity wins
+        """
+        entities = {}
+        for (entity_name, value, _, _) in self.matches(message):
+            entities.setdefault(entity_name, value)
+        return entities
+
+
+class AhoCorasick(object):
+    """Aho-Corasick automaton over characters with whole-word matching"""
+
+    def __init__(self, phrases):
+        """
+        :param phrases: iterable of (phrase, entity name, value)
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for (phrase, entity_name, value) in phrases:
+            state = 0
+            for char in phrase:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = next_state
+            self.out[state].append((len(phrase), entity_name, value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.out[next_state] = (self.out[next_state] +
+                                        self.out[self.fail[next_state]])
+
+    def search(self, text):
+        found = []
+        state = 0
+        for (end, char) in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if not self.out[state]:
+                continue
+            if end < len(text) and text[end].isalnum():
+                continue
+            for (length, entity_name, value) in self.out[state]:
+                start = end - length
+                if start == 0 or not text[start - 1].isalnum():
+                    found.append((start, end, entity_name, value))
+
+        # keep leftmost-longest non-overlapping matches
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        matches, last_end = [], 0
+        for (start, end, entity_name, value) in found:
+            if start >= last_end:
+                matches.append((entity_name, value, start, end))
+                last_end = end
+        return matches
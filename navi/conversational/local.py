@@ -0,0 +1,170 @@
+import logging
+import math
+from collections import Counter
+
+import numpy as np
+
+from navi.core import get_intent_examples
+from navi import context as ctx
+from . import ConversationalResponse, normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+class LocalConversationalPlatform(object):
+    """Offline intent classifier trained from the `examples` declared on
+    each `Intent` class.
+
+    usage:
+    ```
+        >>> class TurnOnLightsIntent(Intent):
+        >>>     examples = ["turn on the lights", "lights on please"]
+        >>>
+        >>> local_platform = LocalConversationalPlatform()
+        >>> bot.start(conversational_platforms=[local_platform])
+    ```
+    """
+
+    def __init__(self, examples=None, ngram_range=(2, 4),
+                 min_confidence=0.3):
+        """
+        :param examples: optional dictionary of intent name to example
+        utterances. If not provided, examples are collected from the
+        declared `Intent` classes on `start`
+
+        :param ngram_range: smallest and largest character n-grams used as
+        features
+
+        :param min_confidence: cosine similarity under which no intent is
+        reported
+        """
+        self.examples = examples
+        self.min_confidence = min_confidence
+        self.model = CharNgramModel(ngram_range=ngram_range)
+
+    def start(self):
+        examples = self.examples
+        if examples is None:
+            examples = get_intent_examples()
+        self.train(examples)
+        ctx.general()['local_nlu'] = self
+
+    def train(self, examples):
+        """Fit the model on a dictionary of intent name to utterances"""
+        utterances, labels = [], []
+        for intent_name, intent_examples in examples.items():
+            utterances.extend(intent_examples)
+            labels.extend([intent_name] * len(intent_examples))
+        self.model.fit(utterances, labels)
+        logger.info("Trained local NLU on %d examples of %d intents",
+                    len(utterances), len(examples))
+
+    def classify(self, message):
+        """Return the best (intent name, confidence) for a message"""
+        return self.model.predict(message)
+
+    def parser(self, session, message, context):
+
+        intent_name, confidence = self.classify(message)
+        if confidence < self.min_confidence:
+            intent_name = None
+
+        original_res = {'intent': intent_name, 'score': confidence}
+
+        # follow-up turns fill slots of the intent already in context
+        if intent_name is None and 'intent' in context:
+            confidence = 1.0
+
+        return ConversationalResponse(intent=intent_name,
+                                      entities={},
+                                      ready=False,
+                                      original_res=original_res,
+                                      confidence=confidence)
+
+
+class CharNgramModel(object):
+    """TF-IDF weighted character n-gram model with cosine scoring.
+
+    The example matrix is kept column-major (one slice of example indices
+    per n-gram), so scoring a message only touches the n-grams it contains.
+    """
+
+    def __init__(self, ngram_range=(2, 4)):
+        self.ngram_range = ngram_range
+        self.vocabulary = {}
+        self.labels = []
+        self.idf = np.zeros(0)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.data = np.zeros(0)
+
+    def ngrams(self, message):
+        text = " {} ".format(normalize_message(message))
+        (low, high) = self.ngram_range
+        return Counter(text[i:i + n]
+                       for n in range(low, high + 1)
+                       for i in range(len(text) - n + 1))
+
+    def fit(self, utterances, labels):
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        for row, utterance in enumerate(utterances):
+            for gram, count in self.ngrams(utterance).items():
+                col = vocabulary.setdefault(gram, len(vocabulary))
+                rows.append(row)
+                cols.append(col)
+                counts.append(count)
+
+        n_examples = len(utterances)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tf = 1.0 + np.log(np.asarray(counts, dtype=np.float64))
+
+        df = np.bincount(cols, minlength=len(vocabulary))
+        idf = np.log((1.0 + n_examples) / (1.0 + df)) + 1.0
+        data = tf * idf[cols]
+
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2,
+                                    minlength=n_examples))
+        norms[norms == 0] = 1.0
+        data /= norms[rows]
+
+        order = np.argsort(cols, kind='mergesort')
+        self.indices = rows[order]
+        self.data = data[order]
+        self.indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self.idf = idf
+        self.vocabulary = vocabulary
+        self.labels = list(labels)
+        return self
+
+    def scores(self, message):
+        """Cosine similarity between a message and every example"""
+        n_examples = len(self.labels)
+        grams = [(self.vocabulary[g], c)
+                 for g, c in self.ngrams(message).items()
+                 if g in self.vocabulary]
+        if n_examples == 0 or not grams:
+            return np.zeros(n_examples)
+
+        cols = np.asarray([g for g, _ in grams], dtype=np.int64)
+        weights = (1.0 + np.log(np.asarray([c for _, c in grams],
+                                           dtype=np.float64)))
+        weights *= self.idf[cols]
+        weights /= math.sqrt(np.dot(weights, weights))
+
+        starts, ends = self.indptr[cols], self.indptr[cols + 1]
+        lengths = ends - starts
+        positions = (np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                     + np.arange(lengths.sum()))
+        return np.bincount(self.indices[positions],
+                           weights=self.data[positions] *
+                           np.repeat(weights, lengths),
+                           minlength=n_examples)
+
+    def predict(self, message):
+        scores = self.scores(message)
+        if len(scores) == 0:
+            return (None, 0.0)
+        best = int(np.argmax(scores))
+        return (self.labels[best], float(scores[best]))
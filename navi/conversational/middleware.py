@@ -0,0 +1,118 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Middleware(object):
+    """Base class for logic plugged around `parse_message`. Override only
+    the hooks you need.
+
+    The `before_*` and `after_nlu` hooks may short-circuit the pipeline by
+    returning a reply; returning None lets the message go on. `after_reply`
+    sees every reply (short-circuited or not) and returns the one to send.
+
+    usage:
+    ```
+        >>> class CannedAnswers(Middleware):
+        >>>     def before_nlu(self, message, context):
+        >>>         if message.lower() == "ping":
+        >>>             return "pong"
+        >>>
+        >>> from navi.conversational import middleware
+        >>> middleware.use(CannedAnswers())
+    ```
+    """
+
+    def before_nlu(self, message, context):
+        return None
+
+    def after_nlu(self, message, response, context):
+        """Receives the `ConversationalResponse`, which may be modified"""
+        return None
+
+    def before_handle(self, intent, handler, context):
+        return None
+
+    def after_reply(self, message, reply, context):
+        return reply
+
+
+class MiddlewareChain(object):
+    """Hooks of all registered middleware composed into single calls"""
+
+    def __init__(self, middlewares):
+        self.before_nlu = _short_circuit_chain(
+            _overridden(middlewares, 'before_nlu'))
+        self.after_nlu = _short_circuit_chain(
+            _overridden(middlewares, 'after_nlu'))
+        self.before_handle = _short_circuit_chain(
+            _overridden(middlewares, 'before_handle'))
+        self.after_reply = _reply_chain(
+            _overridden(middlewares, 'after_reply'))
+
+
+def _overridden(middlewares, hook_name):
+    base_hook = getattr(Middleware, hook_name)
+    hooks = []
+    for middleware in middlewares:
+        hook = getattr(middleware, hook_name, None)
+        if hook is None:
+            continue
+        if getattr(hook, '__func__', None) is getattr(base_hook, '__func__',
+                                                      base_hook):
+            continue
+        hooks.append(hook)
+    return tuple(hooks)
+
+
+def _no_reply(*kvars):
+    return None
+
+
+def _same_reply(message, reply, context):
+    return reply
+
+
+def _short_circuit_chain(hooks):
+    if not hooks:
+        return _no_reply
+
+    def chain(*kvars):
+        for hook in hooks:
+            reply = hook(*kvars)
+            if reply is not None:
+                return reply
+        return None
+
+    return chain
+
+
+def _reply_chain(hooks):
+    if not hooks:
+        return _same_reply
+
+    # innermost middleware sees the reply first
+    hooks = tuple(reversed(hooks))
+
+    def chain(message, reply, context):
+        for hook in hooks:
+            reply = hook(message, reply, context)
+        return reply
+
+    return chain
+
+
+_middlewares = []
+chain = MiddlewareChain(_middlewares)
+
+
+def use(middleware):
+    """Append a middleware to the pipeline. The chain is composed here, at
+    registration, so messages never look hooks up
+    """
+    global chain
+    _middlewares.append(middleware)
+    chain = MiddlewareChain(_middlewares)
+    logger.info("registering middleware {}".format(
+        type(middleware).__name__))
+    return middleware
@@ -0,0 +1,143 @@
+import abc
+import threading
+import logging
+
+from navi.core import get_intent_examples
+from navi import context as ctx
+from . import ConversationalResponse, normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+class UtteranceIndexResolver(object):
+    """Base class for resolvers that look messages up in an index of known
+    utterances. By default the index is filled with the `examples` declared
+    on `Intent` classes
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, utterances=None):
+        """
+        :param utterances: optional dictionary of utterance to either an
+        intent name or an (intent name, entities dict) tuple
+        """
+        self.utterances = utterances
+
+    def start(self):
+        if self.utterances is None:
+            for intent_name, examples in get_intent_examples().items():
+                for example in examples:
+                    self.add(example, intent_name)
+        else:
+            for utterance, target in self.utterances.items():
+                if isinstance(target, tuple):
+                    self.add(utterance, *target)
+                else:
+                    self.add(utterance, target)
+
+    @abc.abstractmethod
+    def add(self, utterance, intent_name, entities=None):
+        pass
+
+    @abc.abstractmethod
+    def parser(self, session, message, context):
+        pass
+
+
+class ExactMatchResolver(UtteranceIndexResolver):
+    """Hash index of normalized utterances to an intent and its entities"""
+
+    def __init__(self, utterances=None):
+        super(ExactMatchResolver, self).__init__(utterances)
+        self.index = {}
+
+    def add(self, utterance, intent_name, entities=None):
+        self.index[normalize_message(utterance)] = (intent_name,
+                                                    entities or {})
+
+    def parser(self, session, message, context):
+        match = self.index.get(normalize_message(message))
+        if match is None:
+            return ConversationalResponse()
+
+        (intent_name, entities) = match
+        return ConversationalResponse(intent=intent_name,
+                                      entities=dict(entities),
+                                      ready=False,
+                                      original_res={'utterance': message},
+                                      confidence=1.0)
+
+
+class TieredConversationalRouter(object):
+    """Try cheap resolvers before the remote conversational platform.
+
+    Tiers are tried in the order they were added. A tier answers the
+    message when it finds an intent with a confidence at or above its
+    threshold, otherwise the next tier is tried. The fallback platform
+    (eg. `WitConversationalPlatform`) answers whatever is left.
+
+    usage:
+    ```
+        >>> router = TieredConversationalRouter(fallback=wit_platform)
+        >>> router.add_tier('exact', ExactMatchResolver(), threshold=1.0)
+        >>> router.add_tier('local', local_platform, threshold=0.6)
+        >>> bot.start(conversational_platforms=[wit_platform, local_platform,
+        >>>                                     router])
+        >>> ...
+        >>> parse_message(message, context,
+        >>>               platform=ConversationalPlatform.tiered)
+    ```
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.tiers = []
+        self._lock = threading.Lock()
+        self._hits = {'fallback': 0}
+        self._total = 0
+
+    def add_tier(self, name, resolver, threshold=0.5):
+        """Add a resolver, which is any object with a conversational
+        platform's `parser(session, message, context)` method
+        """
+        self.tiers.append((name, resolver, threshold))
+        self._hits[name] = 0
+        return self
+
+    def start(self):
+        for (_, resolver, _) in self.tiers:
+            if isinstance(resolver, UtteranceIndexResolver):
+                resolver.start()
+        ctx.general()['nlu_router'] = self
+
+    def parser(self, session, message, context):
+
+        for (name, resolver, threshold) in self.tiers:
+            response = resolver.parser(session, message, context)
+            if (response.intent is not None and
+                    response.confidence >= threshold):
+                logger.info("Resolved by tier %s", name)
+                self._record_hit(name)
+                return response
+
+        if self.fallback is None:
+            self._record_hit('fallback')
+            return ConversationalResponse()
+
+        response = self.fallback.parser(session, message, context)
+        self._record_hit('fallback')
+        return response
+
+    def _record_hit(self, name):
+        with self._lock:
+            self._hits[name] += 1
+            self._total += 1
+
+    def stats(self):
+        """Hits and hit rate of each tier, fallback included"""
+        with self._lock:
+            total = self._total
+            return {name: {'hits': hits,
+                           'rate': float(hits) / total if total else 0.0}
+                    for name, hits in self._hits.items()}
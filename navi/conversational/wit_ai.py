@@ -1,26 +1,141 @@
 import uuid
+from enum import Enum
 from importlib import import_module
 import logging
+import time
+import json
 
 from pydispatch import dispatcher
 from wit import Wit
+from wit.wit import WitError
 
 from navi.core import (Navi, get_handler_for)
 from navi import context as ctx
 from navi.intents import Intent
-from . import ConversationalResponse
+from navi import connections
+from navi import responses
+from navi.resilience import (call_with_timeout, TokenBucket, CircuitBreaker,
+                             CircuitOpen, CallTimeout, LatencyRecorder)
+from . import ConversationalResponse, normalize_message
+from .coalescing import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+WIT_API_HOST = 'https://api.wit.ai'
+WIT_API_VERSION = '20160516'
+
+
+class PooledWit(Wit):
+    """wit client that sends its requests through a navi `HTTPPool`, so
+    connections to wit are kept alive and reused. Requests give up after
+    `timeout` seconds at the socket level, so a call abandoned by
+    `call_with_timeout` doesn't keep its thread and connection forever"""
+
+    def __init__(self, access_token, http_pool, api_host=None, timeout=None,
+                 **kwargs):
+        # wit's client is an old-style class on python 2, no super() there
+        Wit.__init__(self, access_token=access_token, **kwargs)
+        self.http_pool = http_pool
+        self.api_host = (api_host or WIT_API_HOST).rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, params, **kwargs):
+        headers = {
+            'authorization': 'Bearer ' + self.access_token,
+            'accept': 'application/vnd.wit.' + WIT_API_VERSION + '+json',
+        }
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        rsp = self.http_pool.request(method, self.api_host + path,
+                                     headers=headers, params=params,
+                                     **kwargs)
+        if rsp.status_code > 200:
+            raise WitError('Wit responded with status: {} ({})'.format(
+                rsp.status_code, rsp.reason))
+        body = rsp.json()
+        if 'error' in body:
+            raise WitError('Wit responded with an error: ' + body['error'])
+        return body
+
+    def message(self, msg, context=None, verbose=None):
+        params = {}
+        if verbose:
+            params['verbose'] = True
+        if msg:
+            params['q'] = msg
+        if context:
+            params['context'] = json.dumps(context)
+        return self._request('GET', '/message', params)
+
+    def converse(self, session_id, message, context=None, reset=None,
+                 verbose=None):
+        params = {'session_id': session_id}
+        if verbose:
+            params['verbose'] = True
+        if message:
+            params['q'] = message
+        if reset:
+            params['reset'] = True
+        return self._request('POST', '/converse', params, json=context or {})
+
 
 class WitConversationalPlatform(object):
 
-    def __init__(self, key):
+    def __init__(self, key, coalesce_requests=True,
+                 timeout=5.0,
+                 max_retries=1,
+                 retry_rate=0.5,
+                 retry_burst=10,
+                 failure_threshold=5,
+                 reset_timeout=30.0,
+                 fallback=None,
+                 http_pool=None,
+                 base_url=None):
+        """
+        :param key: wit.ai app access token
+
+        :param coalesce_requests: if True, concurrent identical (normalized)
+        messages share a single in-flight call to wit
+
+        :param timeout: seconds to wait for each call to wit before giving up
+        on it, None waits forever
+
+        :param max_retries: retries for a failed or timed out call. Retries
+        are drawn from a token bucket refilled at `retry_rate` tokens per
+        second up to `retry_burst`, so a struggling service is not flooded
+
+        :param failure_threshold: consecutive failed messages that open the
+        circuit breaker. While it is open, wit is not called for
+        `reset_timeout` seconds and messages go to the fallback instead
+
+        :param fallback: optional resolver (any object with a `parser`
+        method, eg. `LocalConversationalPlatform`) used when wit is
+        unavailable. Without one, the message ends in a parsing error
+
+        :param http_pool: `HTTPPool` used to reach wit, defaults to navi's
+        shared pool
+
+        :param base_url: wit API URL, defaults to wit.ai's. Point it at a
+        `FakeWit` to run without a live token
+        """
         self.key = key
+        self.single_flight = SingleFlight() if coalesce_requests else None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_budget = TokenBucket(retry_rate, retry_burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyRecorder()
+        self.fallback = fallback
+        self.http_pool = http_pool
+        self.base_url = base_url
 
     def start(self):
 
-        self.client = Wit(access_token=self.key)
+        if self.http_pool is None:
+            self.http_pool = connections.shared_pool()
+        self.client = PooledWit(self.key, self.http_pool,
+                                api_host=self.base_url,
+                                timeout=self.timeout)
         ctx.general()['wit_ai'] = self
         ctx.general()['wit_client'] = self.client
 
@@ -45,12 +160,69 @@ class WitConversationalPlatform(object):
     def _new_user_context_created(self, context):
         pass
 
+    def stats(self):
+        """Request coalescing, circuit breaker and latency metrics"""
+        stats = {'breaker': self.breaker.stats(),
+                 'latency': self.latency.stats(),
+                 'retry_tokens': self.retry_budget.available()}
+        if self.http_pool is not None:
+            stats['connections'] = self.http_pool.stats()
+        if self.single_flight is not None:
+            stats['requests'] = self.single_flight.stats()
+        return stats
+
+    def _message(self, message):
+        """Call wit's message endpoint guarded by the circuit breaker, with a
+        timeout and budgeted retries
+        """
+        return self._call(self.max_retries, self.client.message, message)
+
+    def _converse(self, session, message, context):
+        """Call wit's converse endpoint guarded by the circuit breaker, with
+        a timeout. A converse step moves the story forward, so it is not
+        retried
+        """
+        return self._call(0, self.client.converse, session, message, context)
+
+    def _call(self, max_retries, func, *kvars):
+        if not self.breaker.allow_request():
+            raise CircuitOpen("wit circuit breaker is open")
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                result = call_with_timeout(self.timeout, func, *kvars)
+                self.latency.record(time.time() - start)
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                self.latency.record(time.time() - start)
+                logger.warning("Wit request failed: %s", e)
+                attempt += 1
+                if (attempt > max_retries or
+                        not self.retry_budget.try_consume()):
+                    self.breaker.record_failure()
+                    raise
+
+    def _fallback_parser(self, session, message, context):
+        if self.fallback is not None:
+            return self.fallback.parser(session, message, context)
+        return ConversationalResponse()
+
     def parser(self, session, message, context):
 
-        client = self.client
         entities, intent_name, confidence = {}, None, 0.0
 
-        converse_result = client.message(message)
+        try:
+            if self.single_flight is not None:
+                converse_result = self.single_flight.do(
+                    normalize_message(message), self._message, message)
+            else:
+                converse_result = self._message(message)
+        except Exception as e:
+            logger.info("Using fallback parser: %s", e)
+            return self._fallback_parser(session, message, context)
 
         if message != "":
             message = ""
@@ -114,88 +286,144 @@ def wit_action(action):
     return decorator
 
 
-def parse_message(message, context):
-    if not context.setdefault("wit_context", {}).setdefault("session_started",
-                                                            False):
-        session = str(uuid.uuid1())
-        context["wit_context"]["session"] = session
-        context["wit_context"]["session_started"] = True
-        context["wit_messages"][session] = []
+class ConverseStep(Enum):
+    """Outcome of a single step of a wit story"""
+    action = 0
+    msg = 1
+    stop = 2
+
+    @classmethod
+    def of(cls, converse_result):
+        """Step type of a converse result. Types navi doesn't run (eg.
+        `merge`) end the story"""
+        try:
+            return cls[converse_result.get('type')]
+        except KeyError:
+            logger.warning("Unsupported wit step type %s, stopping",
+                           converse_result.get('type'))
+            return cls.stop
+
+
+# duration of each converse step, across all conversations
+converse_step_latency = LatencyRecorder()
 
-    if context["wit_context"].get("has_used_error_state", None) == False:
-        context["wit_context"]["has_used_error_state"] = True
-    elif context["wit_context"].get("has_used_error_state", None) == True:
+
+def parse_message(message, context, max_steps=20):
+    """Run wit's stories flow for a message and return the bot messages.
+
+    Wit is asked for the next step of the story until it stops, repeats a
+    message or `max_steps` steps have been taken. Actions are handled as
+    they come and messages are accumulated and returned together
+    """
+    wit_context = context.setdefault("wit_context", {})
+    if not wit_context.setdefault("session_started", False):
+        wit_context["session"] = str(uuid.uuid1())
+        wit_context["session_started"] = True
+
+    if wit_context.get("has_used_error_state", None) == False:
+        wit_context["has_used_error_state"] = True
+    elif wit_context.get("has_used_error_state", None) == True:
         _remove_error_state(context)
 
     logger.info("Context Before Converse: %s", context)
-    client = ctx.general()['wit_client']
-    session = context["wit_context"]["session"]
-    converse_result = client.converse(session,
-                                      message,
-                                      context["wit_context"])
-    logger.info("Converse Result: %s", converse_result)
-    if converse_result['type'] == 'action':
-
-        entities = _simplify_entities_dict(converse_result['entities'])
-        action_name = converse_result['action']
-
-        signal = "wit_action_{}".format(action_name)
-        logger.info("Sent {} signal".format(signal))
-        disp_responses = dispatcher.send(signal=signal, sender=dispatcher.Any,
-                                         message=message,
-                                         entities=entities,
-                                         context=context["wit_context"])
-        (_, intent) = disp_responses[0]
-
-        handler = get_handler_for(intent)
-        if handler is None:
-            logger.warning("No handler for intent %s", type(intent).__name__)
-            return parse_message("", context["wit_context"])
-
-        # 1. Resolve
-        resolve_responses = handler.resolve(intent)
-        (context, must_ask) = _get_resolve_result_into_context(
-            resolve_responses,
-            intent, context)
-
-        if must_ask:  # recusivelly call parse until a message is returned
-            return parse_message("", context)
-
-        # 2. Confirm
-        confirm_response = handler.confirm(intent)
-        (context, is_ready) = _get_confirm_result_into_context(
-            confirm_response, context)
-
-        if not is_ready:
-            return parse_message("", context)
-
-        # 3. Handle
-        handle_response = handler.handle(intent)
-        context = _get_handle_result_into_context(handle_response, context)
-
-        return parse_message("", context)
-
-    if converse_result['type'] == 'msg':
-        if ((context["wit_messages"][session][-1]
-             if len(context["wit_messages"][session]) != 0
-             else None) == converse_result['msg']):
-            # if message is repeated, wit is on a loop
-            messages = context["wit_messages"][session]
-            context["wit_messages"][session] = []
-            return messages
-
-        context["wit_messages"][session].append(converse_result['msg'])
-        return parse_message("", context)
-
-    if converse_result['type'] == 'stop':
+    platform = ctx.general()['wit_ai']
+    session = wit_context["session"]
+    messages = []
+
+    for step in range(max_steps):
+        start = time.time()
         try:
-            if should_close_session():
-                close_session(context)
-            messages = context["wit_messages"][session]
-            context["wit_messages"][session] = []
-            return messages
-        except Exception as e:
-            logger.exception(e)
+            converse_result = platform._converse(session, message,
+                                                 wit_context)
+        except (CallTimeout, CircuitOpen, WitError) as e:
+            logger.warning("Wit story interrupted: %s", e)
+            if messages:
+                break
+            return [_failed_request(context)]
+        logger.info("Converse Result: %s", converse_result)
+        step_type = ConverseStep.of(converse_result)
+
+        if step_type == ConverseStep.action:
+            if not _run_wit_action(converse_result, message, context):
+                break
+        elif step_type == ConverseStep.msg:
+            if messages and messages[-1] == converse_result['msg']:
+                # if message is repeated, wit is on a loop
+                break
+            messages.append(converse_result['msg'])
+
+        elapsed = time.time() - start
+        converse_step_latency.record(elapsed)
+        logger.info("Converse step %d (%s) took %.3fs", step,
+                    step_type.name, elapsed)
+
+        if step_type == ConverseStep.stop:
+            if context.get("should_close_session", False):
+                ctx.set_session_was_closed(context)
+            break
+
+        # only the first step carries the user message
+        message = ""
+    else:
+        logger.warning("Wit story stopped after %d steps", max_steps)
+
+    return messages
+
+
+def _failed_request(context):
+    dispatcher.send(signal="did_fail", sender=dispatcher.Any,
+                    context=context["wit_context"])
+    message = responses.get(for_key="failed_request")
+    if message is None:
+        return "failed_request"
+    return message
+
+
+def _run_wit_action(converse_result, message, context):
+    """Build the intent for a wit action and run it through its handler,
+    leaving the results on the wit context
+    """
+    entities = _simplify_entities_dict(converse_result.get('entities', {}))
+    action_name = converse_result['action']
+
+    signal = "wit_action_{}".format(action_name)
+    logger.info("Sent {} signal".format(signal))
+    disp_responses = dispatcher.send(signal=signal, sender=dispatcher.Any,
+                                     message=message,
+                                     entities=entities,
+                                     context=context["wit_context"])
+    if len(disp_responses) == 0:
+        logger.warning("No function registered for wit action %s",
+                       action_name)
+        return False
+    (_, intent) = disp_responses[0]
+
+    handler = get_handler_for(intent)
+    if handler is None:
+        logger.warning("No handler for intent %s", type(intent).__name__)
+        return True
+
+    # 1. Resolve
+    resolve_responses = handler.resolve(intent, context["wit_context"])
+    (context, must_ask) = _get_resolve_result_into_context(
+        resolve_responses,
+        intent, context)
+
+    if must_ask:  # wit will ask the user for more info on its next step
+        return True
+
+    # 2. Confirm
+    confirm_response = handler.confirm(intent, context["wit_context"])
+    (context, is_ready) = _get_confirm_result_into_context(
+        confirm_response, context)
+
+    if not is_ready:
+        return True
+
+    # 3. Handle
+    handle_response = handler.handle(intent, context["wit_context"])
+    _get_handle_result_into_context(handle_response, context)
+    return True
 
 
 def _simplify_entities_dict(entities_dict):
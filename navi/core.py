@@ -9,9 +9,11 @@ import time
 import inspect
 
 from pydispatch import dispatcher
+from concurrent.futures import Future
 import schedule
 
 from .notebooks import Notebook
+from .workers import OrderedExecutor
 
 logger = logging.getLogger('navi')
 
@@ -195,6 +197,20 @@ def get_intent_and_fill_slots(name, entities, context):
         return None
 
 
+def get_intent_examples():
+    """Collect the example utterances declared on every `Intent` class
+
+    :rtype: A dictionary of intent name to a list of example utterances
+    """
+    logger.info("Sent intent_examples signal")
+    responses = dispatcher.send(signal="intent_examples",
+                                sender=dispatcher.Any)
+    examples = {}
+    for (_, (name, intent_examples)) in responses:
+        examples.setdefault(name, []).extend(intent_examples)
+    return examples
+
+
 def entity_from_entities_or_context(entity_name, entities, context):
     a = [entities.get(entity_name, None), context.get(entity_name, None)]
     return next((item for item in a if item is not None), None)
@@ -230,6 +246,9 @@ class NaviEntryPoint(object):
 
     __metaclass__ = abc.ABCMeta
 
+    # set by `use_async_replies`
+    sender = None
+
     def __init__(self, name):
         self.name = name
         logger.info("registering entry point '{}'".format(name))
@@ -240,6 +259,16 @@ class NaviEntryPoint(object):
     def _get_self_reference(self):
         return self
 
+    def use_async_replies(self, workers=4):
+        """Deliver this entry point's replies in the background. Bot
+        functions return as soon as their replies are queued, and each
+        user's replies are still delivered in order. Failed deliveries are
+        logged and sent on the `did_fail_to_reply` signal
+        """
+        self.sender = OrderedExecutor(workers=workers,
+                                      on_failure=_did_fail_to_reply)
+        return self
+
     @abc.abstractmethod
     def build_request(self, *kvars, **kwargs):
         pass
@@ -266,10 +295,34 @@ class NaviResponse(object):
 
     __metaclass__ = abc.ABCMeta
 
+    # set by `entry_point` when replies are delivered in the background
+    sender = None
+    user_id = None
+
     @abc.abstractmethod
     def reply(self, message):
         pass
 
+    def reply_async(self, message):
+        """Deliver a reply through the entry point's sender, returning a
+        future of its delivery. Replies to the same user keep their order.
+        Without a sender, the reply is delivered right away
+        """
+        if self.sender is not None:
+            return self.sender.submit(self.user_id, self.reply, message)
+
+        future = Future()
+        try:
+            future.set_result(self.reply(message))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _did_fail_to_reply(user_id, error):
+    dispatcher.send(signal="did_fail_to_reply", sender=dispatcher.Any,
+                    user_id=user_id, error=error)
+
 
 def entry_point(entry_point_name):
 
@@ -286,6 +339,8 @@ def entry_point(entry_point_name):
             # create general req and res objects
             request = entry_point_obj.build_request(*kvars, **kwargs)
             response = entry_point_obj.build_response(*kvars, **kwargs)
+            response.user_id = request.user_id
+            response.sender = entry_point_obj.sender
 
             import context as ctx
             context = ctx.for_user(request.user_id)
@@ -295,12 +350,18 @@ def entry_point(entry_point_name):
 
             reply_message = func(request.message, context)
 
-            if reply_message is not None:
-                if isinstance(reply_message, list):
-                    for message in reply_message:
-                        response.reply(message)
-                else:
-                    response.reply(reply_message)
+            if reply_message is None:
+                return None
+
+            if not isinstance(reply_message, list):
+                reply_message = [reply_message]
+
+            if response.sender is not None:
+                return [response.reply_async(message)
+                        for message in reply_message]
+
+            for message in reply_message:
+                response.reply(message)
 
         callback_signal = "cb_for_entry_point_{}".format(entry_point_name)
         dispatcher.connect(wrap_and_call,
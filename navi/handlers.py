@@ -1,8 +1,14 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 from pydispatch import dispatcher
+from concurrent.futures import wait
 
 from navi.core import Navi
+from navi import workers
+from navi.resilience import CallTimeout
 from navi.intents import Entity, Intent, FulfilledIntent
 
 logger = logging.getLogger("__name__")
@@ -26,35 +32,119 @@ class IntentHandler(object):
     Execute intended action and return result
     """
 
+    # entities whose resolver runs on every turn, even if their value has not
+    # changed since it was last resolved
+    always_resolve = ()
+
+    # if True, resolvers of different entities run concurrently on navi's
+    # shared thread pool, which pays off when they are I/O bound
+    parallel_resolve = False
+
+    # seconds each stage may take before the user gets the stage's
+    # `Intent.TimeoutResponse` reply. A stage that misses its deadline is
+    # abandoned and the handler is marked as cancelled.
+    # With `parallel_resolve`, the resolve stage misses its deadline as soon
+    # as one entity's resolver has not finished by `resolve_deadline`
+    resolve_deadline = None
+    confirm_deadline = None
+    handle_deadline = None
+
+    # set by `cache_handle` on handlers whose results may be reused
+    handle_cache = None
+
+    # if set, concurrent `handle` calls for the same intent arriving within
+    # this many seconds are grouped into a single `handle_batch` call
+    batch_window = None
+    max_batch_size = 100
+
+    # if True, `handle` runs on navi's process pool so CPU heavy work doesn't
+    # hold the GIL for every other conversation. The handler, intent and
+    # context are rebuilt on the worker, see `workers.handle_in_process`
+    cpu_bound = False
+
     def resolve(self, intent, context):
         """Check if all needed parameters are set. Complain if not.
 
+        Entities already resolved as ready (or not required) on a previous
+        turn of the conversation are not resolved again unless their value
+        changed or they are listed on `always_resolve`.
+
         :param intent: an intent object of type TVSeriesEpisodeIntent
         :param context: a dictionary describing current context
         :rtype: A resolve response
         """
 
         resolve_responses = {}
+        resolved = context.setdefault("resolved_entities", {}).setdefault(
+            type(intent).__name__, {})
 
+        pending = []
         entities = [i for i in dir(intent.__class__) if isinstance(
             getattr(intent.__class__, i), Entity)]
         for entity_name in entities:
-            try:
-                method_name = "resolve_{}".format(entity_name)
-                method = getattr(self, method_name)
-                resolution = method(getattr(intent, entity_name), context)
-                resolve_responses[entity_name] = resolution
-                logger.info("{}: {}".format(entity_name, resolution))
-            except Exception as e:
-                logger.info(str(e))
-                resolution = Intent.ResolveResponse.not_required
-                resolve_responses[entity_name] = resolution
-                logger.info("{}: {}".format(
-                    entity_name,
-                    Intent.ResolveResponse.not_required))
+            value = getattr(intent, entity_name)
+            if _can_reuse_resolution(resolved.get(entity_name), value,
+                                     entity_name in self.always_resolve):
+                resolve_responses[entity_name] = resolved[entity_name][1]
+                logger.info("{}: {} (unchanged)".format(
+                    entity_name, resolved[entity_name][1]))
+            else:
+                pending.append((entity_name, value))
+
+        # a single entity still goes through the pool when there is a
+        # deadline, since `_run_stage` leaves it to this method to enforce
+        if self.parallel_resolve and pending and (
+                len(pending) > 1 or self.resolve_deadline is not None):
+            resolutions = self._resolve_concurrently(pending, context)
+        else:
+            resolutions = [self._resolve_entity(entity_name, value, context)
+                           for (entity_name, value) in pending]
+
+        missed = []
+        for ((entity_name, value), resolution) in zip(pending, resolutions):
+            if resolution is None:
+                missed.append(entity_name)
+                continue
+            resolve_responses[entity_name] = resolution
+            resolved[entity_name] = (value, resolution)
 
+        if missed:
+            raise CallTimeout("Resolving {} missed the {}s deadline".format(
+                ", ".join(missed), self.resolve_deadline))
         return resolve_responses
 
+    def _resolve_entity(self, entity_name, value, context):
+        try:
+            method_name = "resolve_{}".format(entity_name)
+            method = getattr(self, method_name)
+            resolution = method(value, context)
+            logger.info("{}: {}".format(entity_name, resolution))
+        except Exception as e:
+            logger.info(str(e))
+            resolution = Intent.ResolveResponse.not_required
+            logger.info("{}: {}".format(
+                entity_name,
+                Intent.ResolveResponse.not_required))
+        return resolution
+
+    def _resolve_concurrently(self, pending, context):
+        """Resolutions of `pending`, None for those that missed the
+        deadline"""
+        pool = workers.thread_pool()
+        futures = [pool.submit(self._resolve_entity, entity_name, value,
+                               context)
+                   for (entity_name, value) in pending]
+        wait(futures, timeout=self.resolve_deadline)
+
+        resolutions = []
+        for ((entity_name, _), future) in zip(pending, futures):
+            if future.done():
+                resolutions.append(future.result())
+            else:
+                future.cancel()
+                resolutions.append(None)
+        return resolutions
+
     def confirm(self, intent, context):
         """Optional. Perform any final validation of the intent parameters
         and to verify that you are ready to handle the intent
@@ -73,6 +163,26 @@ class IntentHandler(object):
         return Intent.HandleResponse(Intent.HandleResponse.Status.success,
                                      {})
 
+    def handle_batch(self, intents, contexts):
+        """Optional. Handle many intents of the same kind at once, eg. with a
+        single backend request. Only used when `batch_window` is set
+
+        :param intents: list of intent objects
+        :param contexts: list with the context of each intent's user
+        :rtype: A list with one `Intent.HandleResponse` for each intent
+        """
+        return [self.handle(intent, context)
+                for (intent, context) in zip(intents, contexts)]
+
+    def cancel(self):
+        """Called when a stage misses its deadline"""
+        self._cancelled = True
+
+    def is_cancelled(self):
+        """Long running stages may check this to stop cooperatively once
+        their result is no longer awaited"""
+        return getattr(self, '_cancelled', False)
+
     def schedule(self, intent):
         pass
 
@@ -84,6 +194,91 @@ class IntentHandler(object):
         return cls()
 
 
+def _can_reuse_resolution(previous, value, always_resolve):
+    if previous is None or always_resolve:
+        return False
+    (previous_value, resolution) = previous
+    return (previous_value == value and
+            resolution in (Intent.ResolveResponse.ready,
+                           Intent.ResolveResponse.not_required))
+
+
+class HandleCache(object):
+    """LRU cache of successful `Intent.HandleResponse` objects with a time to
+    live, keyed by intent class and entity values
+    """
+
+    def __init__(self, ttl=60, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def key_for(self, intent):
+        entities = sorted((i, getattr(intent, i)) for i in dir(intent.__class__)
+                          if isinstance(getattr(intent.__class__, i), Entity))
+        return (type(intent).__name__, repr(entities))
+
+    def _count(self, intent_name, metric):
+        metrics = self.metrics.setdefault(
+            intent_name, {'hits': 0, 'misses': 0, 'evictions': 0})
+        metrics[metric] += 1
+
+    def get(self, intent):
+        key = self.key_for(intent)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self._count(key[0], 'misses')
+                return None
+            self.entries[key] = self.entries.pop(key)
+            self._count(key[0], 'hits')
+            return entry[1]
+
+    def set(self, intent, handle_response):
+        if handle_response.status != Intent.HandleResponse.Status.success:
+            return
+        key = self.key_for(intent)
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time(), handle_response)
+            while len(self.entries) > self.max_size:
+                (evicted, _) = self.entries.popitem(last=False)
+                self._count(evicted[0], 'evictions')
+
+    def stats(self):
+        """Hits, misses and evictions per intent"""
+        with self._lock:
+            return {name: dict(metrics)
+                    for name, metrics in self.metrics.items()}
+
+
+def cache_handle(ttl=60, max_size=256):
+    """Cache the successful results of an idempotent handler. Its `handle`
+    is skipped while a result for the same intent and entity values is
+    cached
+
+    usage:
+    ```
+        >>> @handler_for_intent(WeatherIntent)
+        >>> @cache_handle(ttl=600, max_size=1000)
+        >>> class WeatherHandler(IntentHandler):
+        >>>     ...
+    ```
+
+    """
+
+    def class_decorator(Cls):
+        Cls.handle_cache = HandleCache(ttl=ttl, max_size=max_size)
+        return Cls
+
+    return class_decorator
+
+
 def handler_for_intent(intent):
     """Similar to flask's decorator, this should allow us to link `Intents` 
     with their handlers
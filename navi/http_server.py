@@ -0,0 +1,29 @@
+import json
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each connection on a daemon thread, shared by
+    navi's embedded servers (webhook, entry points and local stand-ins)"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def respond(request, status, payload=None):
+    """Answer a `BaseHTTPRequestHandler` request with `payload` as JSON, or
+    with an empty body when there is none"""
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    request.send_response(status)
+    if payload is not None:
+        request.send_header('Content-Type', 'application/json')
+    request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    if body:
+        request.wfile.write(body)
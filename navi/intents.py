@@ -19,6 +19,9 @@ class IntentClassWatcher(type):
             signal = "intent_class_{}".format(name)
             dispatcher.connect(cls.get_class, signal=signal)
 
+            if clsdict.get('examples'):
+                dispatcher.connect(cls.get_examples, signal="intent_examples")
+
         super(IntentClassWatcher, cls).__init__(name, bases, clsdict)
 
 
@@ -31,6 +34,9 @@ class Intent(object):
 
     __metaclass__ = IntentClassWatcher
 
+    # example utterances used to train local conversational platforms
+    examples = []
+
     def __init__(self, **kwargs):
         entities = [i for i in dir(self) if isinstance(
             getattr(self, i), Entity)]
@@ -41,6 +47,10 @@ class Intent(object):
     def get_class(cls):
         return cls
 
+    @classmethod
+    def get_examples(cls):
+        return (cls.__name__, list(cls.examples))
+
     class ResolveResponse(Enum):
         """Base Intent Resolving Response.
         The resolve stage is where the intent handler may request for missing
@@ -71,6 +81,12 @@ class Intent(object):
             self.status = status
             self.response_dict = response_dict
 
+    class TimeoutResponse(Enum):
+        """Stage of the handling that did not finish within its deadline"""
+        resolve = 12
+        confirm = 13
+        handle = 14
+
 
 class Entity(object):
 
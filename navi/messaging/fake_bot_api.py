@@ -0,0 +1,291 @@
+from collections import deque
+import json
+import random
+import re
+import threading
+import time
+import logging
+
+try:
+    from urllib2 import Request, urlopen
+    from urlparse import parse_qsl
+except ImportError:
+    from urllib.request import Request, urlopen
+    from urllib.parse import parse_qsl
+
+from navi.http_server import (ThreadingHTTPServer, BaseHTTPRequestHandler,
+                              respond)
+from navi.resilience import LatencyRecorder
+from .webhook import SECRET_TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+_method_pattern = re.compile(r'^/bot([^/]+)/(\w+)$')
+
+
+class FakeBotAPI(object):
+    """Local stand-in for the Telegram Bot API, for load testing the
+    messaging path without reaching telegram.
+
+    It implements `getMe`, `getUpdates` (with long polling), `setWebhook`,
+    `deleteWebhook` and `sendMessage` for any token. Updates are pushed
+    one by one or generated at a given rate, and are either handed to
+    `getUpdates` or POSTed to the registered webhook. Every `sendMessage`
+    is recorded with the time it arrived, and its latency is measured from
+    the oldest unanswered update of the same chat.
+
+    usage:
+    ```
+        >>> api = FakeBotAPI()
+        >>> api.start()
+        >>> telegram = Telegram("telegram", "123:fake",
+        >>>                     base_url=api.base_url)
+        >>> ...
+        >>> api.generate(rate=200, users=1000, count=10000)
+        >>> api.stats()
+    ```
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, username='navi_test_bot'):
+        """
+        :param port: port the server listens on, 0 picks a free one
+
+        :param username: username returned by `getMe`
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.server = None
+
+        self.replies = []
+        self.latency = LatencyRecorder(size=100000)
+        self.webhook_url = None
+        self.secret_token = None
+
+        self._updates = deque()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._pending = {}
+        self._deliveries = deque()
+        self._cond = threading.Condition()
+        self.pushed = 0
+
+    @property
+    def base_url(self):
+        """URL to give `Telegram(base_url=...)`"""
+        return "http://{}:{}/bot".format(self.host, self.port)
+
+    def start(self):
+        """Start serving on a daemon thread"""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                api._handle(self)
+
+            def do_POST(self):
+                api._handle(self)
+
+            def log_message(self, format, *kvars):
+                logger.debug(format, *kvars)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        for target in (self.server.serve_forever, self._deliver):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+        logger.info("Fake Bot API listening on %s", self.base_url)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def push_update(self, chat_id, text):
+        """Queue a private text message from `chat_id`"""
+        now = time.time()
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            update = _text_update(update_id, self._message_id(), chat_id,
+                                  text, now)
+            self._pending.setdefault(chat_id, deque()).append(now)
+            self.pushed += 1
+            if self.webhook_url is None:
+                self._updates.append(update)
+            else:
+                self._deliveries.append(update)
+            self._cond.notify_all()
+        return update_id
+
+    def generate(self, rate=100, users=100, count=1000,
+                 texts=("hello",), seed=0):
+        """Push `count` updates at `rate` per second from `users` distinct
+        chats, blocking until they are all pushed
+        """
+        rng = random.Random(seed)
+        start = time.time()
+        for i in range(count):
+            wait = start + float(i) / rate - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self.push_update(rng.randrange(users) + 1, rng.choice(texts))
+
+    def wait_for_replies(self, count, timeout=60):
+        """Block until `count` replies were recorded, returns whether they
+        were"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while len(self.replies) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._cond:
+            replies = len(self.replies)
+            first = self.replies[0]['received_at'] if replies else None
+            last = self.replies[-1]['received_at'] if replies else None
+        stats = {'updates': self.pushed,
+                 'replies': replies,
+                 'latency': self.latency.stats()}
+        if replies > 1 and last > first:
+            stats['replies_per_second'] = (replies - 1) / (last - first)
+        return stats
+
+    def _message_id(self):
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return message_id
+
+    def _handle(self, request):
+        match = _method_pattern.match(request.path.split('?', 1)[0])
+        if match is None:
+            return respond(request, 404, {'ok': False, 'error_code': 404,
+                                           'description': "Not Found"})
+
+        method = getattr(self, '_api_{}'.format(match.group(2)), None)
+        if method is None:
+            return respond(request, 404, {'ok': False, 'error_code': 404,
+                                           'description': "Not Found"})
+
+        try:
+            params = _params(request)
+            result = method(params)
+        except (ValueError, KeyError) as e:
+            return respond(request, 400, {'ok': False, 'error_code': 400,
+                                           'description': str(e)})
+        respond(request, 200, {'ok': True, 'result': result})
+
+    def _api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': "Navi",
+                'username': self.username}
+
+    def _api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.time() + float(params.get('timeout') or 0)
+        with self._cond:
+            if self.webhook_url is not None:
+                raise ValueError("Conflict: webhook is active")
+            while self._updates and self._updates[0]['update_id'] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [update for (_, update) in
+                    zip(range(limit), self._updates)]
+
+    def _api_setWebhook(self, params):
+        with self._cond:
+            self.webhook_url = params.get('url') or None
+            self.secret_token = params.get('secret_token') or None
+            if self.webhook_url is not None:
+                self._deliveries.extend(self._updates)
+                self._updates.clear()
+                self._cond.notify_all()
+        return True
+
+    def _api_deleteWebhook(self, params):
+        with self._cond:
+            self.webhook_url = None
+        return True
+
+    def _api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        text = params['text']
+        now = time.time()
+        with self._cond:
+            pending = self._pending.get(chat_id)
+            if pending:
+                self.latency.record(now - pending.popleft())
+            self.replies.append({'chat_id': chat_id, 'text': text,
+                                 'received_at': now})
+            message = {'message_id': self._message_id(), 'date': int(now),
+                       'chat': {'id': chat_id, 'type': 'private'},
+                       'from': self._api_getMe(params), 'text': text}
+            self._cond.notify_all()
+        return message
+
+    def _deliver(self):
+        """POST queued updates to the webhook, one at a time and in order,
+        retrying while it fails like telegram does"""
+        while True:
+            with self._cond:
+                while not self._deliveries or self.webhook_url is None:
+                    self._cond.wait()
+                update = self._deliveries[0]
+                (url, secret_token) = (self.webhook_url, self.secret_token)
+
+            headers = {'Content-Type': 'application/json'}
+            if secret_token:
+                headers[SECRET_TOKEN_HEADER] = secret_token
+            try:
+                urlopen(Request(url, json.dumps(update).encode('utf-8'),
+                                headers), timeout=10).read()
+            except Exception as e:
+                logger.warning("Webhook delivery failed: %s", e)
+                time.sleep(1)
+                continue
+
+            with self._cond:
+                if self._deliveries and self._deliveries[0] is update:
+                    self._deliveries.popleft()
+
+
+def _text_update(update_id, message_id, chat_id, text, sent_at):
+    message = {'message_id': message_id,
+               'date': int(sent_at),
+               'chat': {'id': chat_id, 'type': 'private'},
+               'from': {'id': chat_id, 'is_bot': False,
+                        'first_name': "User {}".format(chat_id)},
+               'text': text}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                'length': len(text.split(' ', 1)[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def _params(request):
+    """Parameters from the query string and the JSON or form body"""
+    params = {}
+    if '?' in request.path:
+        params.update(parse_qsl(request.path.split('?', 1)[1]))
+
+    length = int(request.headers.get('Content-Length') or 0)
+    if not length:
+        return params
+    body = request.rfile.read(length).decode('utf-8')
+    if 'json' in (request.headers.get('Content-Type') or ''):
+        params.update(json.loads(body))
+    else:
+        params.update(parse_qsl(body))
+    return params
+
@@ -0,0 +1,335 @@
+import json
+import threading
+import logging
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from concurrent.futures import Future
+from pydispatch import dispatcher
+
+from navi.core import NaviEntryPoint, NaviRequest, NaviResponse
+from navi.http_server import (ThreadingHTTPServer, BaseHTTPRequestHandler,
+                              respond)
+from navi.workers import OrderedExecutor
+from . import websocket
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPEntryPoint(NaviEntryPoint):
+    """Entry point for web chats and internal services, over plain HTTP and
+    websockets.
+
+    Messages are JSON objects with a `user_id` and a `message`. A POST to
+    `path` takes one message and answers with its replies,
+    `{"replies": [...]}`. It may also take a batch, `{"messages": [...]}`,
+    in which case the replies are streamed back as they are produced, one
+    JSON line per reply (`{"index": 0, "user_id": ..., "reply": ...}`),
+    over a chunked response. A websocket opened on `ws_path` takes messages
+    (or lists of messages) as text frames and pushes every reply back as
+    `{"user_id": ..., "reply": ...}`, including replies sent later on. A
+    user is served by one open websocket at a time.
+
+    usage:
+    ```
+        >>> http = HTTPEntryPoint("http", port=8080, workers=16)
+        >>> @entry_point("http")
+        >>> def take_care_of_messages(message, context):
+        >>>     ...
+        >>> bot.start(messaging_platforms=[http])
+    ```
+    ```
+        $ curl -d '{"user_id": 1, "message": "hi"}' localhost:8080/messages
+    ```
+    """
+
+    def __init__(self, name, host='0.0.0.0', port=8080, path='/messages',
+                 ws_path='/ws', workers=None, max_batch_size=1000):
+        """
+        :param host: interface the server listens on
+
+        :param port: port the server listens on, 0 picks a free one
+
+        :param workers: if set, messages from different users are processed
+        in parallel by this many workers. Messages from the same user are
+        still processed one at a time, in order
+
+        :param max_batch_size: most messages accepted in a single batch
+        """
+        super(HTTPEntryPoint, self).__init__(name)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.ws_path = ws_path
+        self.max_batch_size = max_batch_size
+        self.server = None
+        self.executor = None
+        if workers:
+            self.executor = OrderedExecutor(workers=workers)
+
+        # open websockets of each user, so later replies reach them
+        self._sockets = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Serve until the process exits"""
+        self.listen()
+        self.server.serve_forever()
+
+    def listen(self):
+        """Bind the server without serving yet, so `port` is known"""
+        entry_point = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                entry_point._handle_post(self)
+
+            def do_GET(self):
+                entry_point._handle_get(self)
+
+            def log_message(self, format, *kvars):
+                logger.debug(format, *kvars)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        logger.info("HTTP entry point listening on %s:%d", self.host,
+                    self.port)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def build_request(self, message, user_id, **kwargs):
+        return HTTPRequest(message, user_id)
+
+    def build_response(self, message, user_id, sink, **kwargs):
+        return HTTPResponse(self, user_id, sink)
+
+    def connected_users(self):
+        with self._lock:
+            return len(self._sockets)
+
+    def process(self, message, user_id, sink):
+        """Run a message through the bot, in order with the user's other
+        messages. `sink(reply)` receives each reply. Returns a `Future`
+        resolved once the message was processed and its replies delivered
+        """
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(self._process(message, user_id, sink))
+            except Exception as e:
+                logger.exception(e)
+                future.set_exception(e)
+            return future
+        return self.executor.submit(user_id, self._process, message,
+                                    user_id, sink)
+
+    def _process(self, message, user_id, sink):
+        callback_signal = "cb_for_entry_point_{}".format(self.name)
+        responses = dispatcher.send(signal=callback_signal, sender=self,
+                                    message=message, user_id=user_id,
+                                    sink=sink)
+        # replies may be delivered in the background (`use_async_replies`),
+        # or by another process; their failures are this message's
+        for (_, result) in responses:
+            for future in (result or []):
+                if isinstance(future, Future):
+                    future.result()
+
+    def _handle_get(self, request):
+        if (request.path.split('?', 1)[0] == self.ws_path and
+                websocket.is_upgrade(request)):
+            return self._serve_websocket(request)
+        respond(request, 404, {'error': "Not Found"})
+
+    def _handle_post(self, request):
+        if request.path.split('?', 1)[0] != self.path:
+            return respond(request, 404, {'error': "Not Found"})
+
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+            data = json.loads(request.rfile.read(length).decode('utf-8'))
+            is_batch = isinstance(data, dict) and 'messages' in data
+            if is_batch:
+                messages = [_parse(m) for m in data['messages']]
+                if len(messages) > self.max_batch_size:
+                    raise ValueError("Batches take at most {} "
+                                     "messages".format(self.max_batch_size))
+            else:
+                (message, user_id) = _parse(data)
+        except (ValueError, TypeError, KeyError) as e:
+            return respond(request, 400, {'error': str(e)})
+
+        if is_batch:
+            return self._stream_batch(request, messages)
+
+        replies = []
+        sink = _Sink(replies.append)
+        try:
+            self.process(message, user_id, sink).result()
+        except Exception as e:
+            return respond(request, 500, {'error': str(e)})
+        finally:
+            sink.closed = True
+        respond(request, 200, {'replies': replies})
+
+    def _stream_batch(self, request, messages):
+        """Process a batch, writing each reply as soon as it is produced"""
+        lines = Queue()
+        sinks = []
+
+        def submit_all():
+            for (index, (message, user_id)) in enumerate(messages):
+                sink = _Sink(lambda reply, index=index, user_id=user_id:
+                             lines.put({'index': index, 'user_id': user_id,
+                                        'reply': reply}))
+                sinks.append(sink)
+                future = self.process(message, user_id, sink)
+                future.add_done_callback(
+                    lambda done, index=index:
+                    lines.put(_done_line(index, done)))
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/x-ndjson')
+        request.send_header('Transfer-Encoding', 'chunked')
+        request.end_headers()
+
+        t = threading.Thread(target=submit_all)
+        t.daemon = True
+        t.start()
+
+        finished = 0
+        try:
+            while finished < len(messages):
+                line = lines.get()
+                if line.get('done'):
+                    finished += 1
+                    if 'error' not in line:
+                        continue
+                _write_chunk(request, json.dumps(line) + "\n")
+            _write_chunk(request, "")
+        finally:
+            t.join()
+            for sink in sinks:
+                sink.closed = True
+
+    def _serve_websocket(self, request):
+        socket = websocket.accept(request)
+        sinks = {}
+
+        try:
+            while True:
+                try:
+                    data = json.loads(socket.receive())
+                    if not isinstance(data, list):
+                        data = [data]
+                    messages = [_parse(m) for m in data]
+                except (ValueError, TypeError, KeyError) as e:
+                    socket.send(json.dumps({'error': str(e)}))
+                    continue
+
+                for (message, user_id) in messages:
+                    sink = sinks.get(user_id) or self._bind(socket, user_id)
+                    if sink is None:
+                        socket.send(json.dumps({
+                            'user_id': user_id,
+                            'error': "user_id is bound to another socket"}))
+                        continue
+                    sinks[user_id] = sink
+                    self.process(message, user_id, sink)
+        except websocket.ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                for (user_id, sink) in sinks.items():
+                    sink.closed = True
+                    if self._sockets.get(user_id) is sink:
+                        del self._sockets[user_id]
+            request.close_connection = True
+
+    def _bind(self, socket, user_id):
+        """Sink of a user on `socket`, or None if another live socket
+        already serves that user"""
+        with self._lock:
+            if user_id in self._sockets:
+                return None
+            sink = self._sockets[user_id] = _socket_sink(socket, user_id)
+            return sink
+
+    def _user_sink(self, user_id):
+        """Sink reaching the user's open websocket, if there is one"""
+        with self._lock:
+            return self._sockets.get(user_id)
+
+
+class HTTPRequest(NaviRequest):
+    pass
+
+
+class HTTPResponse(NaviResponse):
+
+    def __init__(self, entry_point, user_id, sink):
+        self.entry_point = entry_point
+        self.user_id = user_id
+        self.sink = sink
+
+    def reply(self, message):
+        """Deliver a reply to the request that brought the message, or to
+        the user's websocket once that request is over"""
+        sink = self.sink
+        if sink.closed:
+            sink = self.entry_point._user_sink(self.user_id)
+        if sink is None:
+            logger.warning("Dropped reply to %s, who is not connected",
+                           self.user_id)
+            return None
+        return sink(message)
+
+
+class _Sink(object):
+    """Where the replies to a message go, until `closed`"""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.closed = False
+
+    def __call__(self, reply):
+        return self.deliver(reply)
+
+
+def _socket_sink(socket, user_id):
+    return _Sink(lambda reply: socket.send(
+        json.dumps({'user_id': user_id, 'reply': reply})))
+
+
+def _parse(data):
+    message = data['message']
+    if not isinstance(message, (type(u''), str)):
+        raise ValueError("message must be a string")
+    if data.get('user_id') is None:
+        raise ValueError("user_id is required")
+    return (message, data['user_id'])
+
+
+def _done_line(index, future):
+    line = {'index': index, 'done': True}
+    if future.exception() is not None:
+        line['error'] = str(future.exception())
+    return line
+
+
+def _write_chunk(request, text):
+    data = text.encode('utf-8')
+    request.wfile.write("{:x}\r\n".format(len(data)).encode('ascii') +
+                        data + b"\r\n")
+    request.wfile.flush()
+
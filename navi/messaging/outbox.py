@@ -0,0 +1,236 @@
+from collections import deque
+import threading
+import time
+import logging
+
+from concurrent.futures import Future
+
+from navi.resilience import TokenBucket, LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class _Outgoing(object):
+
+    def __init__(self, chat_id, text, parse_mode):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.enqueued_at = time.time()
+        self.future = Future()
+        # cleared once a merged send including it failed
+        self.mergeable = _is_balanced(text, parse_mode)
+
+
+def _is_balanced(text, parse_mode):
+    """Whether a message's markup can't run into the message merged after
+    it. Telegram's markdown entities are delimited by `*`, `_` and
+    backticks, each must come in pairs"""
+    if parse_mode is None or parse_mode.lower() != 'markdown':
+        return True
+    return all(text.count(c) % 2 == 0 for c in ('*', '_', '`'))
+
+
+class SendQueue(object):
+    """Outbound message queue that keeps a bot within telegram's flood
+    limits.
+
+    A single worker sends the queued messages, taking chats round robin.
+    Each send takes a token from the chat's bucket and from the global
+    bucket. A `RetryAfter` (429) pauses all sending for the time telegram
+    asks for, and the messages are retried. Consecutive messages queued
+    for the same chat with the same parse mode are merged into one send
+    while they fit in `merge_limit` characters, unless their markdown is
+    unbalanced. If telegram rejects a merged send, its messages are sent
+    again one by one, so only the faulty one fails. Messages to the same
+    chat are always sent in the order they were queued.
+
+    usage:
+    ```
+        >>> telegram = Telegram("telegram", key,
+        >>>                     send_queue=SendQueue(global_rate=30))
+        >>> ...
+        >>> telegram.send_queue.stats()
+    ```
+    """
+
+    def __init__(self, global_rate=30, global_burst=30, per_chat_rate=1,
+                 per_chat_burst=3, merge=True, merge_limit=4096):
+        """
+        :param global_rate: messages per second across all chats
+
+        :param per_chat_rate: messages per second to a single chat
+
+        :param merge: if True, consecutive messages to a chat may be merged
+        into a single send of at most `merge_limit` characters
+        """
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.merge = merge
+        self.merge_limit = merge_limit
+
+        self.bot = None
+        self._chats = {}
+        self._buckets = {}
+        self._ready = deque()
+        self._queued = 0
+        self._blocked_until = 0
+        self._swept_at = time.time()
+        self._cond = threading.Condition()
+
+        self.latency = LatencyRecorder()
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+        self.failures = 0
+
+    def start(self, bot):
+        self.bot = bot
+        t = threading.Thread(target=self._run)
+        t.daemon = True
+        t.start()
+
+    def put(self, chat_id, text, parse_mode=None):
+        """Queue a message, returns a `Future` resolved once it is sent"""
+        outgoing = _Outgoing(chat_id, text, parse_mode)
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = deque()
+                self._ready.append(chat_id)
+            chat.append(outgoing)
+            self._queued += 1
+            self._cond.notify()
+        return outgoing.future
+
+    def stats(self):
+        with self._cond:
+            return {'queued': self._queued,
+                    'chats': len(self._chats),
+                    'sent': self.sent,
+                    'merged': self.merged,
+                    'retries': self.retries,
+                    'failures': self.failures,
+                    'buckets': len(self._buckets),
+                    'latency': self.latency.stats()}
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(
+                self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _evict_idle_buckets(self):
+        """Forget the buckets of chats with nothing queued that refilled
+        completely, a new bucket would behave the same. Keeps broadcasts
+        to many chats from growing `_buckets` forever"""
+        now = time.time()
+        if now - self._swept_at < 1:
+            return
+        self._swept_at = now
+        with self._cond:
+            idle = [chat_id for (chat_id, bucket) in self._buckets.items()
+                    if chat_id not in self._chats and
+                    bucket.available() >= bucket.capacity]
+            for chat_id in idle:
+                del self._buckets[chat_id]
+
+    def _next_chat(self):
+        """Round robin over chats with queued messages. Returns the first one
+        allowed to send now, or None and the seconds until one is"""
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            shortest_wait = None
+            for _ in range(len(self._ready)):
+                chat_id = self._ready[0]
+                wait = self._bucket(chat_id).wait_time()
+                if wait <= 0:
+                    self._ready.popleft()
+                    return (chat_id, 0)
+                self._ready.rotate(-1)
+                if shortest_wait is None or wait < shortest_wait:
+                    shortest_wait = wait
+            return (None, shortest_wait)
+
+    def _take_batch(self, chat_id):
+        with self._cond:
+            chat = self._chats[chat_id]
+            batch = [chat.popleft()]
+            while (self.merge and chat and
+                   batch[-1].mergeable and chat[0].mergeable and
+                   chat[0].parse_mode == batch[0].parse_mode and
+                   sum(len(o.text) + 2 for o in batch) + len(chat[0].text)
+                   <= self.merge_limit):
+                batch.append(chat.popleft())
+            self._queued -= len(batch)
+            return batch
+
+    def _requeue(self, chat_id, batch):
+        with self._cond:
+            chat = self._chats.setdefault(chat_id, deque())
+            chat.extendleft(reversed(batch))
+            self._queued += len(batch)
+            if chat_id not in self._ready:
+                self._ready.appendleft(chat_id)
+
+    def _release(self, chat_id):
+        with self._cond:
+            if self._chats[chat_id]:
+                self._ready.append(chat_id)
+            else:
+                del self._chats[chat_id]
+
+    def _run(self):
+        while True:
+            self._evict_idle_buckets()
+            (chat_id, wait) = self._next_chat()
+            if chat_id is None:
+                with self._cond:
+                    self._cond.wait(wait)
+                continue
+
+            wait = max(self.global_bucket.wait_time(),
+                       self._blocked_until - time.time())
+            if wait > 0:
+                time.sleep(wait)
+            self.global_bucket.try_consume()
+            self._bucket(chat_id).try_consume()
+
+            batch = self._take_batch(chat_id)
+            text = "\n\n".join(o.text for o in batch)
+            try:
+                result = self.bot.sendMessage(chat_id=chat_id, text=text,
+                                              parse_mode=batch[0].parse_mode)
+            except Exception as e:
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    logger.warning("Flood limit reached, retrying in %ss",
+                                   retry_after)
+                    self.retries += 1
+                    self._blocked_until = time.time() + retry_after
+                    self._requeue(chat_id, batch)
+                    continue
+                if len(batch) > 1:
+                    logger.warning("Merged send failed (%s), sending its %d "
+                                   "messages one by one", e, len(batch))
+                    for outgoing in batch:
+                        outgoing.mergeable = False
+                    self._requeue(chat_id, batch)
+                    continue
+                logger.exception(e)
+                self.failures += len(batch)
+                for outgoing in batch:
+                    outgoing.future.set_exception(e)
+                self._release(chat_id)
+                continue
+
+            now = time.time()
+            self.sent += 1
+            self.merged += len(batch) - 1
+            for outgoing in batch:
+                self.latency.record(now - outgoing.enqueued_at)
+                outgoing.future.set_result(result)
+            self._release(chat_id)
@@ -4,54 +4,187 @@ import inspect
 from importlib import import_module
 import logging
 import time
+import threading
+import re
+import atexit
 
-from telegram.ext import (Updater, MessageHandler, CommandHandler,
-                          Filters)
-from telegram import Bot, ParseMode
+from telegram.ext import Updater, CommandHandler, TypeHandler
+from telegram import Bot, ParseMode, Update
 from pydispatch import dispatcher
 
 from navi.core import Navi, NaviEntryPoint, NaviRequest, NaviResponse
 from navi import context as ctx
+from navi import connections
+from navi.workers import OrderedExecutor
 
 logger = logging.getLogger(__name__)
 
+# send queues of each bot, by token
+_send_queues = {}
+
+# command handlers by command name, filled as commands are registered
+_commands = {}
+_unknown_command = None
+
+_command_pattern = re.compile(r'^/(\w+)(?:@(\w+))?(?:\s+(.*))?$', re.DOTALL)
+
 
 class Telegram(NaviEntryPoint):
 
-    def __init__(self, name, key):
+    def __init__(self, name, key, http_pool=None, webhook=None,
+                 send_queue=None, workers=None, update_log=None,
+                 base_url=None):
+        """
+        :param http_pool: `HTTPPool` used to reach telegram, defaults to
+        navi's shared pool
+
+        :param webhook: if a `Webhook` is provided, updates are received
+        through it instead of long polling
+
+        :param send_queue: if a `SendQueue` is provided, replies are queued
+        and sent within its rate limits instead of right away
+
+        :param workers: if set, updates from different chats are processed
+        in parallel by this many workers. Updates from the same chat are
+        still processed one at a time, in order
+
+        :param update_log: if an `UpdateLog` is provided, polling resumes
+        from its persisted offset and duplicate or stale updates are
+        dropped before reaching the entry point
+
+        :param base_url: Bot API URL the token is appended to, defaults to
+        telegram's. Point it at a `FakeBotAPI` to test locally
+        """
         super(Telegram, self).__init__(name)
 
         self.key = key
-        self.updater = Updater(self.key)
-        self.bot = Bot(token=self.key)
+        self.webhook = webhook
+        self.send_queue = send_queue
+        if send_queue is not None:
+            _send_queues[key] = send_queue
+        self.http_pool = http_pool or connections.shared_pool()
+        self.bot = Bot(token=self.key, base_url=base_url,
+                       request=self.http_pool.telegram_request())
+        self.updater = Updater(bot=self.bot)
+        self._bot_username = None
+        self.update_log = update_log
+        self.update_executor = None
+        if workers:
+            self.update_executor = OrderedExecutor(workers=workers)
 
     def start(self):
-        """Start Telegram Pooling (for development)"""
-
-        # set handlers
-        tg_msg_handler = MessageHandler(Filters.text,
-                                        self._send_entry_point_signal)
-        tg_comm_handler = MessageHandler(Filters.command,
-                                         self._send_command_signal)
-        self.updater.dispatcher.add_handler(tg_msg_handler)
-        self.updater.dispatcher.add_handler(tg_comm_handler)
-
-        # start pooling
-        self.updater.start_polling()
+        """Start receiving Telegram updates, through the webhook if one was
+        configured or by polling (for development) otherwise"""
+
+        # every update goes through `_dispatch`, so the update log sees
+        # the ones no handler takes too
+        self.updater.dispatcher.add_handler(TypeHandler(Update,
+                                                        self._dispatch))
+
+        if self.send_queue is not None:
+            self.send_queue.start(self.bot)
+
+        if self.update_log is not None:
+            self.updater.last_update_id = self.update_log.offset
+            atexit.register(self.update_log.save)
+
+        if self.webhook is None:
+            # start pooling
+            self.updater.start_polling()
+        else:
+            self._start_webhook()
+
         while True:
             time.sleep(1)
 
-    def _send_entry_point_signal(self, bot, update):
+    def _start_webhook(self):
+        t = threading.Thread(target=self.updater.dispatcher.start)
+        t.daemon = True
+        t.start()
+
+        self.webhook.start(self._receive_update)
+
+        if self.webhook.public_url:
+            self._set_webhook(self.webhook.public_url,
+                              self.webhook.secret_token)
+            logger.info("Registered webhook %s", self.webhook.public_url)
+
+    def _set_webhook(self, url, secret_token=None):
+        # ptb 5.3.1's `bot.setWebhook` only sends `url` and `certificate`,
+        # so the call is made through the bot's request object to also
+        # send `secret_token`
+        data = {'url': url}
+        if secret_token:
+            data['secret_token'] = secret_token
+        return self.bot._request.post(
+            "{}/setWebhook".format(self.bot.base_url), data)
+
+    def _receive_update(self, data):
+        update = Update.de_json(data, self.bot)
+        self.updater.update_queue.put(update)
+
+    def queue_lengths(self):
+        """Updates waiting or being processed for each chat"""
+        if self.update_executor is None:
+            return {}
+        return self.update_executor.queue_lengths()
+
+    def _dispatch(self, bot, update):
+        """Route an update to the command or entry point handler, the way
+        the `Filters.command` and `Filters.text` message handlers did"""
+        log = self.update_log
+        if log is not None and not log.accept(update):
+            return
+
+        text = update.message.text if update.message is not None else None
+        if not text:
+            if log is not None:
+                log.done(update.update_id)
+            return
+        if text.startswith('/'):
+            func = self._command_signal
+        else:
+            func = self._entry_point_signal
+        self._process_in_order(func, bot, update)
+
+    def _process_in_order(self, func, bot, update):
+        if self.update_executor is None:
+            try:
+                return func(bot, update)
+            finally:
+                self._done(update)
+        future = self.update_executor.submit(update.message.chat_id, func,
+                                             bot, update)
+        future.add_done_callback(lambda _: self._done(update))
+
+    def _done(self, update):
+        if self.update_log is not None:
+            self.update_log.done(update.update_id)
+
+    def _entry_point_signal(self, bot, update):
         callback_signal = "cb_for_entry_point_{}".format(self.name)
         dispatcher.send(signal=callback_signal, sender=self,
                         bot=bot, update=update)
 
-    def _send_command_signal(self, bot, update):
-        command = update.message.text.split(' ', 1)[0][1:]
-        signal = "telegram_command_{}".format(command)
-        logger.info("Sent {} signal".format(signal))
-        dispatcher.send(signal=signal, sender=self,
-                        bot=bot, update=update)
+    def _command_signal(self, bot, update):
+        parsed = parse_command(update.message.text)
+        if parsed is None:
+            return
+        (command, addressee, args) = parsed
+
+        if addressee is not None and addressee.lower() != self._username():
+            return  # meant for another bot in the same group
+
+        handler = _commands.get(command, _unknown_command)
+        if handler is None:
+            logger.info("No handler for command '{}'".format(command))
+            return
+        handler(bot, update, args)
+
+    def _username(self):
+        if self._bot_username is None:
+            self._bot_username = (self.bot.username or '').lower()
+        return self._bot_username
 
     def build_request(self, bot, update, **kwargs):
         return TelegramRequest(update.message.text, update.message.chat_id)
@@ -70,13 +203,18 @@ class TelegramResponse(NaviResponse):
         self.update = update
 
     def reply(self, message):
-        reply(self.bot, self.update.message.chat_id, message)
+        return reply(self.bot, self.update.message.chat_id, message)
 
 
 def reply(bot, user, message):
-    """Reply to user infered by context dict."""
+    """Reply to user infered by context dict. If the bot has a send queue,
+    the message is queued and a future of its delivery is returned"""
+
+    send_queue = _send_queues.get(bot.token)
+    if send_queue is not None:
+        return send_queue.put(user, message, parse_mode=ParseMode.MARKDOWN)
 
-    bot.sendMessage(
+    return bot.sendMessage(
         chat_id=user,
         text=message,
         parse_mode=ParseMode.MARKDOWN
@@ -120,7 +258,17 @@ def telegram_entry_point(func):
     return decorator(func)
 
 
-def telegram_command(command):
+def parse_command(text):
+    """Split a `/command@bot arg1 arg2` message into
+    (command, bot username or None, list of arguments)"""
+    match = _command_pattern.match(text or '')
+    if match is None:
+        return None
+    (command, addressee, rest) = match.groups()
+    return (command, addressee, rest.split() if rest else [])
+
+
+def telegram_command(command, pass_args=False):
     """Link a method with a telegram command (a `/command` type of message)
 
     usage: 
@@ -131,24 +279,70 @@ def telegram_command(command):
         >>>     ...
     ```
 
+    With `pass_args`, the words after the command are also given to the
+    function, already split:
+    ```
+        >>> @telegram_command('remind', pass_args=True)
+        >>> def remind(message, context, args):
+        >>>     ...
+    ```
+
     """
 
     def decorator(func):
-        def wrap_and_call(bot, update):
+        def wrap_and_call(bot, update, args=None):
             message = update.message.text
             context = ctx.for_user(update.message.chat_id)
             dispatcher.send(signal="did_receive_text_message")
-            reply_message = func(message, context)
+            if pass_args:
+                if args is None:
+                    args = (parse_command(message) or (None, None, []))[2]
+                reply_message = func(message, context, args)
+            else:
+                reply_message = func(message, context)
             dispatcher.send(signal="did_generate_text_reply")
             if reply_message is not None:
                 reply(bot, update.message.chat_id, reply_message)
             return reply_message
 
-        dispatcher.connect(wrap_and_call,
-                           signal="telegram_command_{}".format(command),
-                           sender=dispatcher.Any)
+        _commands[command] = wrap_and_call
         logger.info("registering {} for command '{}'".format(
             func.__name__, command))
         return wrap_and_call
 
     return decorator
+
+
+def telegram_unknown_command(func):
+    """Link a method with every telegram command that has no handler
+
+    usage:
+    ```
+        >>> from navi.messaging.telegram_platform import (
+        >>>     telegram_unknown_command)
+        >>> @telegram_unknown_command
+        >>> def unknown(message, context, args):
+        >>>     return "Sorry, I don't know that command"
+    ```
+
+    """
+
+    def decorator(func):
+        global _unknown_command
+
+        def wrap_and_call(bot, update, args):
+            message = update.message.text
+            context = ctx.for_user(update.message.chat_id)
+            dispatcher.send(signal="did_receive_text_message")
+            reply_message = func(message, context, args)
+            dispatcher.send(signal="did_generate_text_reply")
+            if reply_message is not None:
+                reply(bot, update.message.chat_id, reply_message)
+            return reply_message
+
+        _unknown_command = wrap_and_call
+        logger.info(
+            "registering {} for unknown commands".format(func.__name__))
+        return wrap_and_call
+
+    return decorator(func)
@@ -0,0 +1,171 @@
+from collections import deque
+import datetime
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLog(object):
+    """Keeps track of the telegram updates already processed, so a restarted
+    bot resumes where it stopped instead of re-processing (or losing) its
+    backlog.
+
+    Every update is `accept`ed as it is received and marked `done` once
+    its handler finished (or when no handler takes it). The offset stored
+    on `path` only moves past updates that are done and were received
+    after updates that are all done too, so updates still queued behind a
+    slow chat are processed again after a crash. It is written at most
+    every `save_interval` seconds and when the bot stops. The ids of the
+    last `seen_size` updates are kept to drop duplicates (eg. webhook
+    retries) before they reach the entry point.
+
+    When polling, telegram forgets the updates confirmed by the next
+    `getUpdates` call; the webhook is the mode where the stored offset
+    brings back unprocessed updates.
+
+    usage:
+    ```
+        >>> telegram = Telegram("telegram", key,
+        >>>                     update_log=UpdateLog("telegram.offset",
+        >>>                                          skip_older_than=300))
+    ```
+    """
+
+    def __init__(self, path=None, seen_size=10000, skip_older_than=None,
+                 save_interval=1.0):
+        """
+        :param path: file the offset is persisted to. If None, it is only
+        kept in memory
+
+        :param seen_size: how many recent update ids are remembered to drop
+        duplicates
+
+        :param skip_older_than: if set, messages sent more than this many
+        seconds ago are dropped, so a cold start after an outage doesn't
+        flood the bot with a stale backlog
+
+        :param save_interval: minimum seconds between writes of the offset
+        """
+        self.path = path
+        self.seen_size = seen_size
+        self.skip_older_than = skip_older_than
+        self.save_interval = save_interval
+
+        # offset to resume from: every update below it was processed
+        self.offset = 0
+        self._resume_offset = 0
+        self._seen = set()
+        self._seen_order = deque()
+        # received updates, in order, as [update id, is done]
+        self._in_flight = deque()
+        self._in_flight_by_id = {}
+        self._saved_offset = 0
+        self._saved_at = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        self.duplicates = 0
+        self.skipped = 0
+
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.offset = int(json.load(f)['offset'])
+        except Exception as e:
+            logger.warning("Ignoring update offset file: %s", e)
+            return
+        self._resume_offset = self._saved_offset = self.offset
+        logger.info("Resuming telegram updates from %d", self.offset)
+
+    def accept(self, update):
+        """Record a received update and tell whether it should be processed.
+        Accepted updates must be marked `done` once processed"""
+        update_id = update.update_id
+        with self._lock:
+            if update_id < self._resume_offset or update_id in self._seen:
+                self.duplicates += 1
+                return False
+            self._remember(update_id)
+            entry = [update_id, False]
+            self._in_flight.append(entry)
+            self._in_flight_by_id[update_id] = entry
+
+        if self._is_stale(update):
+            self.skipped += 1
+            self.done(update_id)
+            return False
+        return True
+
+    def done(self, update_id):
+        """Mark an accepted update as processed"""
+        with self._lock:
+            entry = self._in_flight_by_id.pop(update_id, None)
+            if entry is None:
+                return
+            entry[1] = True
+            while self._in_flight and self._in_flight[0][1]:
+                self.offset = max(self.offset,
+                                  self._in_flight.popleft()[0] + 1)
+            should_save = (time.time() - self._saved_at >=
+                           self.save_interval)
+
+        if should_save:
+            self.save()
+
+    def _remember(self, update_id):
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > self.seen_size:
+            self._seen.discard(self._seen_order.popleft())
+
+    def _is_stale(self, update):
+        if self.skip_older_than is None:
+            return False
+        message = getattr(update, 'message', None)
+        sent_at = _timestamp(getattr(message, 'date', None))
+        if sent_at is None:
+            return False
+        return time.time() - sent_at > self.skip_older_than
+
+    def save(self):
+        """Write the offset to `path`, if it changed"""
+        with self._save_lock:
+            with self._lock:
+                offset = self.offset
+                self._saved_at = time.time()
+            if not self.path or offset == self._saved_offset:
+                return
+
+            tmp_path = "{}.tmp".format(self.path)
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump({'offset': offset}, f)
+                os.rename(tmp_path, self.path)
+            except (IOError, OSError) as e:
+                logger.error("Could not save update offset: %s", e)
+                return
+            self._saved_offset = offset
+
+    def stats(self):
+        with self._lock:
+            return {'offset': self.offset,
+                    'in_flight': len(self._in_flight),
+                    'duplicates': self.duplicates,
+                    'skipped': self.skipped}
+
+
+def _timestamp(date):
+    if date is None:
+        return None
+    if isinstance(date, datetime.datetime):
+        # telegram's dates are built with `datetime.fromtimestamp`
+        return time.mktime(date.timetuple())
+    return float(date)
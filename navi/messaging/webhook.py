@@ -0,0 +1,97 @@
+import hmac
+import json
+import logging
+import threading
+
+from navi.http_server import (ThreadingHTTPServer, BaseHTTPRequestHandler,
+                              respond)
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class Webhook(object):
+    """Embedded HTTP server receiving JSON updates POSTed to `path`.
+
+    Requests must carry `secret_token` on the
+    `X-Telegram-Bot-Api-Secret-Token` header when one is configured. Each
+    decoded update is handed to the `on_update` callback given to `start`.
+
+    It can be exercised locally by POSTing a recorded update:
+    ```
+        $ curl -X POST -H "X-Telegram-Bot-Api-Secret-Token: s3cr3t" \\
+            -d @update.json http://localhost:8443/telegram
+    ```
+    """
+
+    def __init__(self, host='0.0.0.0', port=8443, path='/telegram',
+                 secret_token=None, public_url=None):
+        """
+        :param host: interface the server listens on
+
+        :param port: port the server listens on
+
+        :param path: URL path updates are POSTed to
+
+        :param secret_token: if set, requests without it are rejected
+
+        :param public_url: if set, the URL registered on telegram as the
+        bot's webhook (eg. the address of a TLS terminating proxy)
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.public_url = public_url
+        self.server = None
+
+    def start(self, on_update):
+        """Start serving on a daemon thread"""
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                webhook._handle_post(self, on_update)
+
+            def log_message(self, format, *kvars):
+                logger.debug(format, *kvars)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        logger.info("Webhook listening on %s:%d%s", self.host, self.port,
+                    self.path)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _handle_post(self, request, on_update):
+        if request.path.split('?', 1)[0] != self.path:
+            return respond(request, 404)
+
+        if self.secret_token is not None:
+            token = request.headers.get(SECRET_TOKEN_HEADER) or ''
+            if not hmac.compare_digest(str(token), str(self.secret_token)):
+                return respond(request, 403)
+
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+            data = json.loads(request.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return respond(request, 400)
+
+        try:
+            on_update(data)
+        except Exception as e:
+            logger.exception(e)
+            return respond(request, 500)
+
+        respond(request, 200)
+
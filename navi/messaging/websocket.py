@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import struct
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+def is_upgrade(request):
+    """Whether an HTTP request asks to be upgraded to a websocket"""
+    return ('websocket' in (request.headers.get('Upgrade') or '').lower() and
+            request.headers.get('Sec-WebSocket-Key') is not None)
+
+
+def accept(request):
+    """Complete the opening handshake of an upgrade request received by a
+    `BaseHTTPRequestHandler`, returning the `WebSocket`"""
+    key = request.headers.get('Sec-WebSocket-Key').strip()
+    digest = hashlib.sha1((key + _GUID).encode('ascii')).digest()
+
+    request.send_response(101, 'Switching Protocols')
+    request.send_header('Upgrade', 'websocket')
+    request.send_header('Connection', 'Upgrade')
+    request.send_header('Sec-WebSocket-Accept',
+                        base64.b64encode(digest).decode('ascii'))
+    request.end_headers()
+    request.wfile.flush()
+    return WebSocket(request.rfile, request.wfile)
+
+
+class WebSocket(object):
+    """Server side of a websocket (RFC 6455) over the streams of an upgraded
+    HTTP connection. `receive` is meant to be called from a single thread,
+    `send` may be called from any"""
+
+    def __init__(self, rfile, wfile, max_message_size=1 << 20):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.max_message_size = max_message_size
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def receive(self):
+        """Next text message, raises `ConnectionClosed` once the client has
+        closed the connection"""
+        fragments = []
+        while True:
+            (fin, opcode, payload) = self._read_frame()
+            if opcode == OPCODE_CLOSE:
+                self.close()
+                raise ConnectionClosed()
+            elif opcode == OPCODE_PING:
+                self._write_frame(OPCODE_PONG, payload)
+            elif opcode == OPCODE_PONG:
+                pass
+            else:
+                fragments.append(payload)
+                if sum(len(f) for f in fragments) > self.max_message_size:
+                    self.close(1009)
+                    raise ConnectionClosed()
+                if fin:
+                    return b''.join(fragments).decode('utf-8')
+
+    def send(self, text):
+        self._write_frame(OPCODE_TEXT, text.encode('utf-8'))
+
+    def close(self, code=1000):
+        if self.closed:
+            return
+        try:
+            self._write_frame(OPCODE_CLOSE, struct.pack('!H', code))
+        except (IOError, OSError, ConnectionClosed):
+            pass
+        self.closed = True
+
+    def _read_exactly(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            self.closed = True
+            raise ConnectionClosed()
+        return data
+
+    def _read_frame(self):
+        (first, second) = struct.unpack('!BB', self._read_exactly(2))
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        if not second & 0x80:
+            # clients must mask every frame they send (RFC 6455 5.1)
+            self.close(1002)
+            raise ConnectionClosed()
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack('!H', self._read_exactly(2))
+        elif length == 127:
+            (length,) = struct.unpack('!Q', self._read_exactly(8))
+        if length > self.max_message_size:
+            self.close(1009)
+            raise ConnectionClosed()
+
+        mask = self._read_exactly(4)
+        payload = self._read_exactly(length) if length else b''
+        return (fin, opcode, _unmask(payload, mask))
+
+    def _write_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < (1 << 16):
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+
+        with self._send_lock:
+            if self.closed:
+                raise ConnectionClosed()
+            try:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+            except (IOError, OSError):
+                self.closed = True
+                raise ConnectionClosed()
+
+
+def _unmask(payload, mask):
+    masked = bytearray(payload)
+    mask = bytearray(mask)
+    for i in range(len(masked)):
+        masked[i] ^= mask[i % 4]
+    return bytes(masked)
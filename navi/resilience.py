@@ -0,0 +1,173 @@
+from enum import Enum
+from collections import deque
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CallTimeout(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def call_with_timeout(timeout, func, *kvars, **kwargs):
+    """Run `func` on a separate daemon thread and wait at most `timeout`
+    seconds for it. A call that times out raises `CallTimeout` and is
+    abandoned: it keeps running, but its result is discarded.
+    """
+    if timeout is None:
+        return func(*kvars, **kwargs)
+
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome['result'] = func(*kvars, **kwargs)
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    t = threading.Thread(target=run)
+    t.daemon = True
+    t.start()
+
+    if not done.wait(timeout):
+        raise CallTimeout("{} did not finish in {}s".format(
+            getattr(func, '__name__', func), timeout))
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket refilled continuously at `rate` tokens per
+    second up to `capacity` tokens
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_consume(self, tokens=1):
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` tokens are available"""
+        with self._lock:
+            self._refill()
+            missing = tokens - self.tokens
+            if missing <= 0:
+                return 0.0
+            if self.rate <= 0:
+                return float('inf')
+            return missing / self.rate
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class CircuitBreaker(object):
+    """Trip after `failure_threshold` consecutive failures and reject calls
+    for `reset_timeout` seconds, then let a single trial call through
+    (half open) to decide whether to close again.
+    """
+
+    class State(Enum):
+        closed = 0
+        open = 1
+        half_open = 2
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreaker.State.closed
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == CircuitBreaker.State.closed:
+                return True
+            if self.state == CircuitBreaker.State.open:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = CircuitBreaker.State.half_open
+                return True
+            # a trial call is already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.state = CircuitBreaker.State.closed
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if (self.state == CircuitBreaker.State.half_open or
+                    self.consecutive_failures >= self.failure_threshold):
+                if self.state != CircuitBreaker.State.open:
+                    logger.warning("Circuit breaker opened after %d failures",
+                                   self.consecutive_failures)
+                    self.trips += 1
+                self.state = CircuitBreaker.State.open
+                self.opened_at = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state.name,
+                    'consecutive_failures': self.consecutive_failures,
+                    'trips': self.trips}
+
+
+class LatencyRecorder(object):
+    """Keep the last `size` latency samples and report their percentiles"""
+
+    def __init__(self, size=1024):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def percentiles(self, percentiles=(50, 90, 99)):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {}
+        return {"p{}".format(p):
+                samples[min(len(samples) - 1, len(samples) * p // 100)]
+                for p in percentiles}
+
+    def stats(self):
+        stats = self.percentiles()
+        stats['count'] = self.count
+        return stats
@@ -0,0 +1,392 @@
+from bisect import bisect
+from collections import OrderedDict
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import logging
+
+from concurrent.futures import Future
+from pydispatch import dispatcher
+from pydispatch.errors import DispatcherKeyError
+
+from navi.core import (NaviEntryPoint, NaviRequest, NaviResponse,
+                       _did_fail_to_reply)
+from navi.workers import OrderedExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing(object):
+    """Consistent hashing of keys onto `nodes` slots. Each slot owns
+    `replicas` points of the ring, so keys are spread evenly and a given
+    key always lands on the same slot"""
+
+    def __init__(self, nodes, replicas=100):
+        points = sorted((_hash("{}:{}".format(node, replica)), node)
+                        for node in range(nodes)
+                        for replica in range(replicas))
+        self._hashes = [point for (point, _) in points]
+        self._nodes = [node for (_, node) in points]
+
+    def node_for(self, key):
+        i = bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[i]
+
+
+def _hash(text):
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class Supervisor(object):
+    """Runs the bot on `workers` processes, each with the full navi stack
+    and its own `Navi.context`, behind the messaging platforms of this
+    (front) process.
+
+    Users are consistently hashed to a worker, so a user's context always
+    lives in the same process. The front process builds the request and
+    response of each message on its entry point and sends the message to
+    the user's worker over a pipe; the worker runs the bot function and
+    sends the replies back, which the front delivers through the original
+    response. A worker that dies is restarted on the same slot, so its
+    users keep going to it (with a fresh context) and the others are
+    untouched. Messages it had not finished fail, and are logged and sent
+    on the `did_fail_to_reply` signal.
+
+    Workers are forked from the front process (the `fork` start method is
+    required, so this does not run on Windows) and inherit `setup` as it
+    is, without pickling. `setup` is called on each worker after it is
+    forked and must prepare the bot there without starting messaging
+    platforms, which stay on the front process. The front process should
+    not import the bot's interfaces, and `setup` must not rely on locks or
+    threads of the front process: restarted workers are forked while the
+    front is serving, and only the forking thread survives in them.
+
+    usage:
+    ```
+        >>> def setup():
+        >>>     Navi(my_bot)
+        >>>     wit_ai.WitConversationalPlatform(key).start()
+        >>>
+        >>> telegram = Telegram("telegram", key)
+        >>> Supervisor(setup, [telegram], workers=4).start()
+    ```
+    """
+
+    def __init__(self, setup, messaging_platforms, workers=None,
+                 threads_per_worker=1, restart_delay=1.0,
+                 max_idle_users=10000):
+        """
+        :param setup: callable run on each worker to set the bot up
+
+        :param messaging_platforms: entry points running on the front
+        process, their messages are routed to the workers
+
+        :param workers: number of worker processes, defaults to the number
+        of CPUs
+
+        :param threads_per_worker: if more than 1, each worker processes
+        this many users at a time (useful while handlers wait on I/O).
+        Messages from the same user are always processed in order
+
+        :param restart_delay: seconds to wait before restarting a worker
+        that died
+
+        :param max_idle_users: most users whose last response is kept once
+        their messages were processed, so replies a worker sends later on
+        still reach them. The least recently active are forgotten first
+        """
+        self._context = _fork_context()
+        self.setup = setup
+        self.messaging_platforms = messaging_platforms
+        self.workers = workers or multiprocessing.cpu_count()
+        self.threads_per_worker = threads_per_worker
+        self.restart_delay = restart_delay
+        self.max_idle_users = max_idle_users
+        self.ring = HashRing(self.workers)
+
+        self._slots = [_WorkerSlot(i) for i in range(self.workers)]
+        self._request_ids = itertools.count(1)
+        self._pending = {}
+        self._last_responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self):
+        # fork every worker before this process starts any thread
+        for slot in self._slots:
+            self._fork(slot)
+        for slot in self._slots:
+            self._read(slot)
+
+        t = threading.Thread(target=self._monitor)
+        t.daemon = True
+        t.start()
+
+        for platform in self.messaging_platforms:
+            signal = "cb_for_entry_point_{}".format(platform.name)
+            dispatcher.connect(self._route, signal=signal,
+                               sender=dispatcher.Any, weak=False)
+            t = threading.Thread(target=platform.start)
+            t.daemon = True
+            t.start()
+
+        while True:
+            time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            return [{'pid': slot.process.pid if slot.process else None,
+                     'alive': slot.is_alive(),
+                     'restarts': slot.restarts,
+                     'pending': len([1 for (s, _, _) in
+                                     self._pending.values() if s is slot])}
+                    for slot in self._slots]
+
+    def _spawn(self, slot):
+        self._fork(slot)
+        self._read(slot)
+
+    def _fork(self, slot):
+        """Start the worker of `slot`. No lock of this process may be held
+        while forking, so the worker inherits none of them taken"""
+        (front_end, worker_end) = self._context.Pipe()
+        names = [platform.name for platform in self.messaging_platforms]
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_end, self.setup, names, self.threads_per_worker,
+                  self._front_receivers()))
+        process.daemon = True
+        process.start()
+        worker_end.close()
+
+        slot.attach(process, front_end)
+        logger.info("Started worker %d (pid %d)", slot.index, process.pid)
+
+    def _read(self, slot):
+        t = threading.Thread(target=self._read_replies,
+                             args=(slot, slot.connection))
+        t.daemon = True
+        t.start()
+
+    def _front_receivers(self):
+        """Receivers of the front process that forked workers inherit and
+        must drop, so their own entry points are used instead"""
+        receivers = []
+        for platform in self.messaging_platforms:
+            receivers.append((platform._get_self_reference,
+                              "entry_point_named_{}".format(platform.name),
+                              True))
+            receivers.append((self._route,
+                              "cb_for_entry_point_{}".format(platform.name),
+                              False))
+        return receivers
+
+    def _route(self, sender, **kwargs):
+        """Send a message received by an entry point to its user's worker"""
+        request = sender.build_request(**kwargs)
+        response = sender.build_response(**kwargs)
+        slot = self._slots[self.ring.node_for(request.user_id)]
+        request_id = next(self._request_ids)
+        future = Future()
+
+        with self._lock:
+            self._pending[request_id] = (slot, response, future)
+            self._last_responses.pop(request.user_id, None)
+            self._last_responses[request.user_id] = response
+            while len(self._last_responses) > self.max_idle_users:
+                self._last_responses.popitem(last=False)
+        future.add_done_callback(
+            lambda done: _report_failure(request.user_id, done))
+
+        try:
+            slot.send(('message', request_id, sender.name, request.message,
+                       request.user_id))
+        except Exception as e:
+            self._finish(request_id, error=e)
+        return [future]
+
+    def _read_replies(self, slot, connection):
+        while True:
+            try:
+                (kind, request_id, user_id, text) = connection.recv()
+            except (EOFError, IOError, OSError):
+                break
+
+            if kind == 'reply':
+                with self._lock:
+                    pending = self._pending.get(request_id)
+                    response = (pending[1] if pending is not None
+                                else self._last_responses.get(user_id))
+                if response is None:
+                    logger.warning("No response to reply to %s", user_id)
+                    continue
+                try:
+                    response.reply(text)
+                except Exception as e:
+                    logger.exception(e)
+            elif kind == 'done':
+                self._finish(request_id)
+            elif kind == 'error':
+                self._finish(request_id, error=WorkerError(text))
+
+        if slot.connection is connection:
+            self._fail_pending(slot)
+
+    def _finish(self, request_id, error=None):
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return
+        future = pending[2]
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+    def _fail_pending(self, slot):
+        with self._lock:
+            lost = [request_id for (request_id, (s, _, _)) in
+                    self._pending.items() if s is slot]
+        for request_id in lost:
+            self._finish(request_id,
+                         error=WorkerError("worker {} died".format(
+                             slot.index)))
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.restart_delay)
+            for slot in self._slots:
+                if slot.process is not None and not slot.is_alive():
+                    logger.error("Worker %d (pid %d) died with exit code "
+                                 "%s, restarting it", slot.index,
+                                 slot.process.pid, slot.process.exitcode)
+                    slot.restarts += 1
+                    self._fail_pending(slot)
+                    self._spawn(slot)
+
+
+def _fork_context():
+    """multiprocessing context forking workers, which they need to inherit
+    the bot's setup and the front's receivers without pickling them"""
+    if not hasattr(os, 'fork'):
+        raise RuntimeError("Supervisor needs to fork its workers, which "
+                           "this platform does not support")
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        return multiprocessing  # python 2 always forks where it can
+    return get_context('fork')
+
+
+def _report_failure(user_id, future):
+    error = future.exception()
+    if error is None:
+        return
+    logger.error("Message from %s failed: %s", user_id, error)
+    _did_fail_to_reply(user_id, error)
+
+
+class WorkerError(Exception):
+    pass
+
+
+class _WorkerSlot(object):
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.connection = None
+        self.restarts = 0
+        self._send_lock = threading.Lock()
+
+    def attach(self, process, connection):
+        with self._send_lock:
+            if self.connection is not None:
+                self.connection.close()
+            self.process = process
+            self.connection = connection
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def send(self, item):
+        with self._send_lock:
+            self.connection.send(item)
+
+
+class ShardEntryPoint(NaviEntryPoint):
+    """Stand-in for a front process entry point inside a worker. Bot
+    functions registered for the entry point's name are called through it
+    and their replies go back to the front over the pipe"""
+
+    def __init__(self, name, connection, send_lock):
+        super(ShardEntryPoint, self).__init__(name)
+        self.connection = connection
+        self.send_lock = send_lock
+
+    def build_request(self, message, user_id, **kwargs):
+        return NaviRequest(message, user_id)
+
+    def build_response(self, message, user_id, request_id, **kwargs):
+        return ShardResponse(self, request_id, user_id)
+
+    def send(self, item):
+        with self.send_lock:
+            self.connection.send(item)
+
+    def start(self):
+        pass
+
+
+class ShardResponse(NaviResponse):
+
+    def __init__(self, entry_point, request_id, user_id):
+        self.entry_point = entry_point
+        self.request_id = request_id
+        self.user_id = user_id
+
+    def reply(self, message):
+        self.entry_point.send(('reply', self.request_id, self.user_id,
+                               message))
+
+
+def _worker_main(connection, setup, entry_point_names, threads,
+                 front_receivers):
+    for (receiver, signal, weak) in front_receivers:
+        try:
+            dispatcher.disconnect(receiver, signal=signal,
+                                  sender=dispatcher.Any, weak=weak)
+        except DispatcherKeyError:
+            pass
+
+    send_lock = threading.Lock()
+    entry_points = {name: ShardEntryPoint(name, connection, send_lock)
+                    for name in entry_point_names}
+    setup()
+
+    executor = OrderedExecutor(workers=threads) if threads > 1 else None
+
+    def process(request_id, name, message, user_id):
+        entry_point = entry_points[name]
+        try:
+            dispatcher.send(signal="cb_for_entry_point_{}".format(name),
+                            sender=entry_point, message=message,
+                            user_id=user_id, request_id=request_id)
+        except Exception as e:
+            logger.exception(e)
+            entry_point.send(('error', request_id, user_id, str(e)))
+        else:
+            entry_point.send(('done', request_id, user_id, None))
+
+    while True:
+        try:
+            (_, request_id, name, message, user_id) = connection.recv()
+        except (EOFError, IOError, OSError):
+            return  # the supervisor is gone
+
+        if executor is None:
+            process(request_id, name, message, user_id)
+        else:
+            executor.submit(user_id, process, request_id, name, message,
+                            user_id)
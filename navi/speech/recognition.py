@@ -132,15 +132,28 @@ class NaviSpeechRecognitionResponse(NaviResponse):
 
 
 def say(message):
+    """Speak `message` with the `tts_script`. Raises if the script can't be
+    run or exits with an error, so the reply counts as failed"""
 
-    from subprocess import call
+    from subprocess import call, CalledProcessError
     message = "\"{}\"".format(message.encode('utf-8'))
+    command = NaviSpeechRecognition.tts_script.format(message)
+    logger.info("running {}".format(command))
     try:
-        command = NaviSpeechRecognition.tts_script.format(message)
-        logger.info("running {}".format(command))
-        call(command, shell=True)
+        status = call(command, shell=True)
     except Exception as e:
         logger.error(str(e))
+        raise
+    if status != 0:
+        logger.error("{} exited with status {}".format(command, status))
+        raise CalledProcessError(status, command)
+
+
+def _say_or_log(message):
+    try:
+        say(message)
+    except Exception:
+        pass  # already logged by `say`
 
 
 def message_from_speech(func):
@@ -187,9 +200,9 @@ def message_from_speech(func):
             if reply_message is not None:
                 if isinstance(reply_message, list):
                     for rmessage in reply_message:
-                        say(rmessage)
+                        _say_or_log(rmessage)
                 else:
-                    say(reply_message)
+                    _say_or_log(reply_message)
             return reply_message
 
         logger.info(
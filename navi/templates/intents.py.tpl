@@ -8,5 +8,8 @@ from navi.intents import Intent, Entity
 
 class DoSomethingAwesomeIntent(Intent):
 
+    # example utterances train navi's local conversational platform
+    examples = ["do something awesome", "show me something amazing"]
+
     awesomeness_level = Entity()
     type_of_awesome = Entity()
\ No newline at end of file
@@ -0,0 +1,246 @@
+from importlib import import_module
+import pickle
+import multiprocessing
+from collections import deque
+import threading
+import logging
+
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                Future, TimeoutError)
+
+from navi.intents import Entity, Intent
+from navi.resilience import CallTimeout
+
+logger = logging.getLogger(__name__)
+
+_thread_pool = None
+_thread_pool_size = 16
+_process_pool = None
+_process_pool_size = None
+_process_pool_modules = []
+_process_handle_timeout = 60.0
+_lock = threading.Lock()
+
+
+def configure(thread_pool_size=16, process_pool_size=None,
+              process_pool_modules=None, process_handle_timeout=60.0):
+    """Set up navi's shared pools. Must be called before they are first used
+
+    :param thread_pool_size: workers of the shared thread pool
+
+    :param process_pool_size: workers of the process pool used by CPU bound
+    handlers, defaults to the number of CPUs
+
+    :param process_pool_modules: modules imported by each process worker
+    when it starts (eg. your bot's handlers), so the first requests don't
+    pay for it
+
+    :param process_handle_timeout: seconds a CPU bound handler without a
+    `handle_deadline` may take on the process pool before it is given up
+    """
+    global _thread_pool_size, _process_pool_size, _process_pool_modules
+    global _process_handle_timeout
+    with _lock:
+        if _thread_pool is not None or _process_pool is not None:
+            logger.warning("Shared pools already started, ignoring new "
+                           "configuration")
+            return
+        _thread_pool_size = thread_pool_size
+        _process_pool_size = process_pool_size
+        _process_pool_modules = list(process_pool_modules or [])
+        _process_handle_timeout = process_handle_timeout
+
+
+def thread_pool():
+    """Thread pool shared by navi's concurrent stages (eg. parallel entity
+    resolution), created on first use
+    """
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=_thread_pool_size)
+        return _thread_pool
+
+
+def process_pool():
+    """Process pool running the `handle` stage of CPU bound handlers. It is
+    created on first use and its workers are started right away
+    """
+    global _process_pool
+    with _lock:
+        if _process_pool is not None:
+            return _process_pool
+        size = _process_pool_size or multiprocessing.cpu_count()
+        modules = list(_process_pool_modules)
+        try:
+            # every worker imports the modules as it starts (python 3.7+)
+            _process_pool = ProcessPoolExecutor(max_workers=size,
+                                                initializer=_warm_up,
+                                                initargs=(modules,))
+        except TypeError:
+            # older pools have no initializer, `_handle` imports them
+            _process_pool = ProcessPoolExecutor(max_workers=size)
+        pool = _process_pool
+
+    # start the workers outside the lock, so thread pool users don't wait
+    for future in [pool.submit(_warm_up, modules) for _ in range(size)]:
+        future.result()
+    logger.info("Started %d process pool workers", size)
+    return pool
+
+
+def handle_in_process(handler, intent, context):
+    """Run `handler.handle` on the process pool and wait for its
+    `Intent.HandleResponse`.
+
+    Only the handler and intent classes, the entity values and the picklable
+    context values are sent to the worker. Changes the handler makes to the
+    context inside the worker are not brought back; return them on the
+    response dict instead. Raises `CallTimeout` if the worker takes longer
+    than the handler's `handle_deadline` (or the configured
+    `process_handle_timeout`).
+    """
+    timeout = handler.handle_deadline or _process_handle_timeout
+    future = process_pool().submit(_handle,
+                                   _process_pool_modules,
+                                   _class_path(type(handler)),
+                                   _class_path(type(intent)),
+                                   _entity_values(intent),
+                                   _picklable(context))
+    try:
+        (status, response_dict) = future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise CallTimeout("{} did not handle {} in {}s".format(
+            type(handler).__name__, type(intent).__name__, timeout))
+    return Intent.HandleResponse(Intent.HandleResponse.Status(status),
+                                 response_dict)
+
+
+def _class_path(cls):
+    return (cls.__module__, cls.__name__)
+
+
+def _load_class(path):
+    (module_name, class_name) = path
+    return getattr(import_module(module_name), class_name)
+
+
+def _entity_values(intent):
+    cls = type(intent)
+    return {name: getattr(intent, name) for name in dir(cls)
+            if isinstance(getattr(cls, name), Entity)}
+
+
+def _picklable(context):
+    values = {}
+    for key, value in context.items():
+        try:
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        values[key] = value
+    return values
+
+
+def _warm_up(modules):
+    for module in modules:
+        import_module(module)
+
+
+def _handle(modules, handler_path, intent_path, entities, context):
+    _warm_up(modules)  # no-op once imported, covers pools without initializer
+    handler = _load_class(handler_path).create()
+    intent = _load_class(intent_path)(**entities)
+    handle_response = handler.handle(intent, context)
+    # nested classes don't pickle on python 2, send plain values back
+    return (handle_response.status.value, handle_response.response_dict)
+
+
+class OrderedExecutor(object):
+    """Run calls in the background while keeping the calls that share a key
+    (eg. a user id) in submission order.
+
+    Each key has its own queue. Queues are drained one call at a time by a
+    shared pool of `workers` threads, so calls for different keys run in
+    parallel and a busy key doesn't hold the others back. `submit` returns
+    a `Future`; if the call itself returns a `Future`, the returned one
+    follows it.
+    """
+
+    def __init__(self, workers=4, on_failure=None):
+        """
+        :param on_failure: optional callable receiving (key, exception) for
+        every failed call, in addition to the failure set on its future
+        """
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.on_failure = on_failure
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *kvars, **kwargs):
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            is_idle = queue is None
+            if is_idle:
+                queue = self._queues[key] = deque()
+            queue.append((func, kvars, kwargs, future))
+
+        if is_idle:
+            self.pool.submit(self._run_next, key)
+        return future
+
+    def _run_next(self, key):
+        with self._lock:
+            (func, kvars, kwargs, future) = self._queues[key][0]
+
+        try:
+            result = func(*kvars, **kwargs)
+        except Exception as e:
+            self._fail(key, future, e)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            if isinstance(result, Future):
+                result.add_done_callback(
+                    lambda done: self._follow(key, future, done))
+            else:
+                future.set_result(result)
+        finally:
+            # whatever happened, the key moves on to its next call
+            self._schedule_next(key)
+
+    def _schedule_next(self, key):
+        with self._lock:
+            queue = self._queues[key]
+            queue.popleft()
+            if not queue:
+                del self._queues[key]
+                return
+
+        # go to the back of the pool so other keys get their turn
+        self.pool.submit(self._run_next, key)
+
+    def _follow(self, key, future, done):
+        error = done.exception()
+        if error is not None:
+            self._fail(key, future, error)
+        else:
+            future.set_result(done.result())
+
+    def _fail(self, key, future, error):
+        logger.error("Background call for %s failed: %s", key, error)
+        if not future.done():
+            future.set_exception(error)
+        if self.on_failure is not None:
+            try:
+                self.on_failure(key, error)
+            except Exception as e:
+                logger.exception(e)
+
+    def queue_lengths(self):
+        """Calls queued or running for each key"""
+        with self._lock:
+            return {key: len(queue) for key, queue in self._queues.items()}
@@ -22,7 +22,8 @@ setup(name='navi',
       },
       install_requires=[
           'enum34==1.1.6',
-          'PyDispatcher==2.0.5'],
+          'PyDispatcher==2.0.5',
+          'futures==3.1.1; python_version < "3"'],
       extras_require={
           'SpeechRecognition':  [
               "PyAudio==0.2.11",
@@ -31,5 +32,6 @@ setup(name='navi',
               "PyAudio==0.2.11",
               "snowboy"],
           'Telegram': ["python-telegram-bot==5.3.1"],
-          'Wit': ["wit==4.2.0"]}
+          'Wit': ["wit==4.2.0", "requests==2.14.2"],
+          'LocalNLU': ["numpy==1.13.1"]}
       )